@@ -1,6 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import asyncio
 import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
 
 
 def disable(func):
@@ -33,31 +42,334 @@ def decorator(func):
 def countcalls(func):
     '''Decorator that counts calls made to the function decorated.'''
 
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        wrapper.calls += 1
-        return func(*args, **kwargs)
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            wrapper.calls += 1
+            return await func(*args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            wrapper.calls += 1
+            return func(*args, **kwargs)
 
     wrapper.calls = 0
     return wrapper
 
 
-def memo(func):
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_MISSING = object()
+# separates positional arguments from keyword ones in cache key
+_KWARGS_MARK = (object(),)
+
+
+def _make_key(args, kwargs, typed):
+    key = args
+    if kwargs:
+        items = tuple(sorted(kwargs.items()))
+        key += _KWARGS_MARK + items
+    if typed:
+        key += tuple(type(x) for x in args)
+        if kwargs:
+            key += tuple(type(value) for _, value in items)
+    return key
+
+
+class _Flight:
+    '''Computation of one key which other threads wait for'''
+    __slots__ = ('owner', 'done', 'value', 'error')
+
+    def __init__(self):
+        self.owner = threading.get_ident()
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _MemoryStorage:
+    '''Values in OrderedDict, the least recently used one is the first'''
+
+    def __init__(self, maxsize, ttl):
+        self.data = OrderedDict()
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def get(self, key):
+        entry = self.data.get(key, _MISSING)
+        if entry is _MISSING:
+            return _MISSING
+        if self.ttl is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return _MISSING
+        # order matters only for eviction
+        if self.maxsize is not None:
+            self.data.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value):
+        now = None if self.ttl is None else time.monotonic()
+        self.data[key] = (value, None if now is None else now + self.ttl)
+        self.data.move_to_end(key)
+        if self.maxsize is not None:
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+        elif now is not None:
+            # without maxsize values are in order of expiry, expired ones which are not read again are at the start
+            while self.data:
+                first, (_, expires) = next(iter(self.data.items()))
+                if expires > now:
+                    break
+                del self.data[first]
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+def _code_digest(code, digest=None):
+    '''Hash of bytecode, names and constants of function without line numbers and file name'''
+    digest = digest or hashlib.sha256()
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            _code_digest(const, digest)
+        elif isinstance(const, frozenset):
+            # order of set depends on hash seed of process
+            digest.update(repr(sorted(map(repr, const))).encode())
+        else:
+            digest.update(repr(const).encode())
+    return digest
+
+
+def _func_digest(func):
+    '''Hash of code of function and of every decorator wrapper around it, the inner function is found by __wrapped__'''
+    digest = hashlib.sha256()
+    seen = set()
+    while func is not None and id(func) not in seen:
+        seen.add(id(func))
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            _code_digest(code, digest)
+        func = getattr(func, '__wrapped__', None)
+    return digest.hexdigest()
+
+
+class _SqliteStorage:
     '''
-    Memoize a function so that it caches all return values for
-    faster future lookups.
+    Values of one function in sqlite file which can be shared by several processes.
+    Key is hash of pickled arguments, values of other version of function code are removed
+    '''
+    SCHEMA = '''CREATE TABLE IF NOT EXISTS memo (
+        name TEXT NOT NULL,
+        key BLOB NOT NULL,
+        code TEXT NOT NULL,
+        value BLOB NOT NULL,
+        created REAL NOT NULL,
+        used REAL NOT NULL,
+        PRIMARY KEY (name, key)
+    )'''
+
+    def __init__(self, path, func, maxsize, ttl):
+        self.path = path
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.code = _func_digest(func)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local = threading.local()
+
+    def connection(self):
+        # sqlite connection must not be shared by threads and forked processes
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(self.SCHEMA)
+            connection.execute('CREATE INDEX IF NOT EXISTS memo_used ON memo (name, used)')
+            connection.execute('DELETE FROM memo WHERE name = ? AND code != ?', (self.name, self.code))
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def _key(self, key):
+        # protocol is fixed, so keys are the same in all python versions
+        return hashlib.sha256(pickle.dumps(key, protocol=4)).digest()
+
+    def get(self, key):
+        key = self._key(key)
+        connection = self.connection()
+        row = connection.execute('SELECT value, created FROM memo WHERE name = ? AND key = ? AND code = ?',
+                                 (self.name, key, self.code)).fetchone()
+        if row is None:
+            return _MISSING
+        now = time.time()
+        if self.ttl is not None and row[1] + self.ttl <= now:
+            connection.execute('DELETE FROM memo WHERE name = ? AND key = ?', (self.name, key))
+            return _MISSING
+        if self.maxsize is not None:
+            connection.execute('UPDATE memo SET used = ? WHERE name = ? AND key = ?', (now, self.name, key))
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        key = self._key(key)
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        connection = self.connection()
+        now = time.time()
+        # insert and eviction are done at once for all processes
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?, ?)',
+                               (self.name, key, self.code, value, now, now))
+            if self.maxsize is not None:
+                connection.execute('DELETE FROM memo WHERE name = ? AND key IN '
+                                   '(SELECT key FROM memo WHERE name = ? ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                                   (self.name, self.name, self.maxsize))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def clear(self):
+        self.connection().execute('DELETE FROM memo WHERE name = ?', (self.name,))
+
+    def __len__(self):
+        return self.connection().execute('SELECT COUNT(*) FROM memo WHERE name = ?', (self.name,)).fetchone()[0]
+
+
+def memo(func=None, *, maxsize=None, ttl=None, typed=False, single_flight=False, path=None):
     '''
+    Memoize a function so that it caches return values for
+    faster future lookups.
 
-    cache = {}
+    @memo
+    def fib(n):
+        ....
 
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        nonlocal cache
-        all_args = args, tuple(sorted(kwargs.items()))
-        if all_args not in cache:
-            cache[all_args] = func(*args, **kwargs)
-        return cache[all_args]
+    @memo(maxsize=1000, ttl=60, single_flight=True)
+    def load(name):
+        ....
 
+    maxsize - count of values kept, the least recently used one is evicted first,
+    None - no limit. ttl - seconds while value is valid, None - forever.
+    typed - arguments of different types are cached separately (1 and 1.0).
+    single_flight - concurrent callers with the same arguments wait for one
+    computation instead of each computing it.
+    path - keep values in sqlite file, so they survive restart and are shared
+    by processes. Arguments and values must be picklable, values are invalidated
+    when bytecode of the function or of decorators under memo changes.
+    Cache is safe to use from several threads, the function itself is called
+    without lock, so recursion works. wrapper.cache_info() and
+    wrapper.cache_clear() work as in functools.lru_cache.
+    For coroutine functions awaited results are cached, concurrent awaiters
+    of the same arguments always share one task, failed results are not cached.
+    '''
+    if func is None:
+        return functools.partial(memo, maxsize=maxsize, ttl=ttl, typed=typed, single_flight=single_flight,
+                                 path=path)
+
+    if path is None:
+        storage = _MemoryStorage(maxsize, ttl)
+    else:
+        storage = _SqliteStorage(path, func, maxsize, ttl)
+    lock = threading.RLock()
+    flights = {}
+    hits = misses = 0
+
+    def lookup(key):
+        nonlocal hits, misses
+        with lock:
+            value = storage.get(key)
+            if value is _MISSING:
+                misses += 1
+            else:
+                hits += 1
+            return value
+
+    def store(key, value):
+        with lock:
+            storage.set(key, value)
+
+    def compute_once(key, args, kwargs):
+        with lock:
+            # value was stored while lock was released
+            value = storage.get(key)
+            if value is not _MISSING:
+                return value
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = _Flight()
+        if not leader:
+            # recursive call with the same arguments would wait for itself
+            if flight.owner == threading.get_ident():
+                return func(*args, **kwargs)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = func(*args, **kwargs)
+            store(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with lock:
+                del flights[key]
+            flight.done.set()
+
+    def task_done(key, task):
+        with lock:
+            if flights.get(key) is task:
+                del flights[key]
+        # failed and cancelled calls are not cached
+        if not task.cancelled() and task.exception() is None:
+            store(key, task.result())
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = args if not kwargs and not typed else _make_key(args, kwargs, typed)
+            value = lookup(key)
+            if value is not _MISSING:
+                return value
+            # concurrent awaiters of the same arguments share one task
+            with lock:
+                task = flights.get(key)
+                if task is None:
+                    task = flights[key] = asyncio.ensure_future(func(*args, **kwargs))
+                    task.add_done_callback(functools.partial(task_done, key))
+            # cancelled awaiter does not cancel computation for others
+            return await asyncio.shield(task)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # fast path - positional arguments are key as is
+            key = args if not kwargs and not typed else _make_key(args, kwargs, typed)
+            value = lookup(key)
+            if value is not _MISSING:
+                return value
+            if single_flight:
+                return compute_once(key, args, kwargs)
+            value = func(*args, **kwargs)
+            store(key, value)
+            return value
+
+    def cache_info():
+        with lock:
+            return CacheInfo(hits, misses, maxsize, len(storage))
+
+    def cache_clear():
+        nonlocal hits, misses
+        with lock:
+            storage.clear()
+            hits = misses = 0
+
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
     return wrapper
 
 
@@ -101,6 +413,21 @@ def trace(delim):
         level = 0
         delimiter = delim
 
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                nonlocal level
+
+                print(f'{delimiter*level} --> {func.__name__}{args}')
+                level += 1
+                try:
+                    result = await func(*args, **kwargs)
+                finally:
+                    level -= 1
+                print(f'{delimiter * level} <-- {func.__name__}{args} == {result}')
+                return result
+            return wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             nonlocal level
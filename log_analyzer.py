@@ -7,24 +7,207 @@
 #                     '"$http_user_agent" "$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" '
 #                     '$request_time';
 import argparse
+import asyncio
+import cProfile
 import gzip
+import heapq
+import io
 import json
 import logging
+import math
+import mmap
 import os
+import pickle
+import queue
 import re
-from collections import namedtuple
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, suppress
 from datetime import datetime
-from itertools import groupby
-from statistics import median
+from functools import lru_cache, partial
+from itertools import islice
 from string import Template
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
 
 argparser = argparse.ArgumentParser(description='Create report for last log file')
 argparser.add_argument('--config', help='Specify config file', default='./config.cfg')
 argparser.add_argument('-vvs', help='For test')
+argparser.add_argument('--date-from', type=lambda x: datetime.strptime(x, '%Y%m%d'),
+                       help='Create report for dates range from YYYYMMDD')
+argparser.add_argument('--tail', action='store_true',
+                       help='Add lines appended to live nginx-access-ui.log since last run to its report')
+argparser.add_argument('--backfill', action='store_true',
+                       help='Create reports for all logs without report')
+argparser.add_argument('--date-to', type=lambda x: datetime.strptime(x, '%Y%m%d'),
+                       help='Last date of range YYYYMMDD, default - date-from')
+argparser.add_argument('--daemon', action='store_true',
+                       help='Watch LOG_DIR and create report for every new log as soon as it appears')
+argparser.add_argument('--timing', action='store_true', default=None,
+                       help='Log wall time, CPU time, bytes read, lines per second and peak memory of every stage')
+argparser.add_argument('--metrics-file', help='Write stage metrics to file in Prometheus text format')
+argparser.add_argument('--profile', help='Write cProfile stats of run to file')
 
 LogInfo = namedtuple('LogInfo', ['file_path', 'date'])
 
+DEFAULT_CONFIG = {
+    "REPORT_SIZE": 1000,
+    "REPORT_DIR": "./reports",
+    "LOG_DIR": "./log",
+    "MAX_ERRORS": 0.1,
+    "LOG_FILE": None,
+    "QUANTILES": "exact",
+    "QUANTILE_ERROR": 0.01,
+    "WORKERS": 1,
+    "CACHE_DIR": None,
+    "CHECKPOINT_LINES": 0,
+    "URL_QUERY": "keep",
+    "URL_COLLAPSE_IDS": False,
+    "URL_RULES": [],
+    "MAX_URLS": 0,
+    "BACKEND": "python",
+    "REPORT_SIDECAR": False,
+    "GZIP_COMMAND": "auto",
+    "DAEMON_POLL_INTERVAL": 10,
+    "DAEMON_JOBS": 1,
+    "TIMING": False,
+    "METRICS_FILE": None,
+    "PROFILE_FILE": None
+}
+
+LOG_NAME_PATTERN = re.compile(r'nginx-access-ui\.log-([0-9]{8})(\.gz)?')
+
+
+def _peak_rss():
+    """Peak RSS of process or of the largest of its finished child processes"""
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+
+
+def _cpu_time():
+    """
+    CPU time of process and of its finished child processes - logs are parsed in pools of processes,
+    which are joined inside of stage. Workers of daemon are counted only when it stops
+    """
+    if resource is None:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class StageStat:
+    __slots__ = ('calls', 'seconds', 'cpu_seconds', 'bytes_read', 'lines', 'peak_rss')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.bytes_read = 0
+        self.lines = 0
+        self.peak_rss = 0
+
+    @property
+    def lines_per_sec(self):
+        return self.lines / self.seconds if self.seconds else 0.0
+
+
+class RunMetrics:
+    """
+    Wall time, CPU time, bytes read, lines and peak memory of stages of run.
+    Stages are measured only when metrics are enabled, stage with the same name is summed up
+    """
+    METRICS = [
+        ('seconds', 'Wall time of stage in seconds'),
+        ('cpu_seconds', 'CPU time of stage in seconds, with finished child processes'),
+        ('bytes_read', 'Bytes read by stage'),
+        ('lines', 'Log lines processed by stage'),
+        ('lines_per_sec', 'Log lines processed by stage per second'),
+        ('peak_rss', 'Peak resident memory of process or of its largest child at the end of stage in bytes'),
+    ]
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.started = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure block of code as stage, block sets bytes_read and lines of yielded StageStat
+        :param name: name of stage
+        """
+        stat = StageStat()
+        if not self.enabled:
+            yield stat
+            return
+        started, cpu_started = time.perf_counter(), _cpu_time()
+        yield stat
+        total = self.stages.setdefault(name, StageStat())
+        total.calls += 1
+        total.seconds += time.perf_counter() - started
+        total.cpu_seconds += _cpu_time() - cpu_started
+        total.bytes_read += stat.bytes_read
+        total.lines += stat.lines
+        total.peak_rss = max(total.peak_rss, _peak_rss())
+
+    def log(self):
+        for name, stat in self.stages.items():
+            logging.info(f'Stage {name}: {stat.seconds:.3f}s wall, {stat.cpu_seconds:.3f}s CPU, '
+                         f'{stat.bytes_read} bytes read, {stat.lines_per_sec:.0f} lines/s, '
+                         f'peak RSS {stat.peak_rss / 2 ** 20:.1f} MB')
+
+    def prometheus(self, success):
+        """
+        Metrics in Prometheus text format
+        :param success: run is finished without exception
+        :return: str
+        """
+        lines = []
+        for metric, help_text in self.METRICS:
+            lines.append(f'# HELP log_analyzer_stage_{metric} {help_text}')
+            lines.append(f'# TYPE log_analyzer_stage_{metric} gauge')
+            for name, stat in self.stages.items():
+                lines.append(f'log_analyzer_stage_{metric}{{stage="{name}"}} {getattr(stat, metric)}')
+        finished = time.time()
+        for metric, help_text, value in [
+            ('run_seconds', 'Wall time of run in seconds', finished - self.started),
+            ('run_success', '1 if run is finished without exception', int(success)),
+            ('last_run_timestamp_seconds', 'Time of the end of run', finished),
+        ]:
+            lines.append(f'# HELP log_analyzer_{metric} {help_text}')
+            lines.append(f'# TYPE log_analyzer_{metric} gauge')
+            lines.append(f'log_analyzer_{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename, success):
+        # textfile collector must not read half written file
+        with open(f'{filename}.tmp', 'w') as metrics_file:
+            metrics_file.write(self.prometheus(success))
+        os.replace(f'{filename}.tmp', filename)
+
+
+run_metrics = RunMetrics()
+
 
 def file_iter(filename: str):
     # default open
@@ -38,36 +221,459 @@ def file_iter(filename: str):
             yield line
 
 
+def mmap_file_iter(filename: str):
+    """
+    Lines of plain file as bytes, file is read through mmap
+    :param filename: address of file
+    :return: iterator of bytes
+    """
+    with open(filename, 'rb') as file:
+        # empty file can not be mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from iter(mapped.readline, b'')
+
+
 def parse_config(filename=None):
-    config = {
-        "REPORT_SIZE": 1000,
-        "REPORT_DIR": "./reports",
-        "LOG_DIR": "./log",
-        "MAX_ERRORS": 0.1,
-        "LOG_FILE": None
-    }
+    config = dict(DEFAULT_CONFIG)
     with open(filename, 'r') as conf_file:
         config.update(json.load(conf_file))
+    if config['CACHE_DIR'] is None:
+        config['CACHE_DIR'] = f'{config["REPORT_DIR"]}/cache'
     return config
 
 
+def _scan_logs(folder):
+    """Names of logs in folder with date string from name"""
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            match = LOG_NAME_PATTERN.fullmatch(entry.name)
+            if match:
+                yield entry.name, match.group(1)
+
+
+def find_logs(folder):
+    """
+    Search all logs in folder - there is date in log name
+    :param folder: folder with logs
+    :return: list of LogInfo - file name, date of log
+    """
+    with run_metrics.stage('find_logs'):
+        return [LogInfo(f'{folder}/{name}', datetime.strptime(date, '%Y%m%d')) for name, date in _scan_logs(folder)]
+
+
 def get_last_log(folder):
     """
     Search last log in folder - there is date in log name
     :param folder: folder with logs
-    :return: tuple - file name, date of log, function to open it (depends on file format)
+    :return: LogInfo - file name, date of log or None
     """
-    log_files = [x for x in os.listdir(folder) if re.fullmatch("nginx-access-ui\.log-[0-9]{8}(\.gz)?", x)]
-    if not log_files:
+    last_name, last_date = None, ''
+    # YYYYMMDD strings are compared in the same order as dates
+    for name, date in _scan_logs(folder):
+        if date > last_date:
+            last_name, last_date = name, date
+    if last_name is None:
         return None
+    return LogInfo(f'{folder}/{last_name}', datetime.strptime(last_date, '%Y%m%d'))
+
+
+class ExactQuantiles:
+    """Keeps all values and returns exact quantiles (linear interpolation)"""
+    __slots__ = ('values',)
 
-    files_with_data = [(x, datetime.strptime(x.split('.')[1][4:], '%Y%m%d')) for x in log_files]
-    last_log = max(files_with_data, key=lambda x: x[1])
-    log_info = LogInfo(
-        f'{folder}/{last_log[0]}',
-        last_log[1]
+    def __init__(self, relative_error=None):
+        # typed array keeps 8 bytes per value instead of a float object
+        self.values = array('d')
+
+    def add(self, value):
+        self.values.append(value)
+
+    def merge(self, other):
+        self.values.extend(other.values)
+
+    def quantiles(self, qs):
+        """
+        :param qs: iterable of quantiles in [0, 1]
+        :return: list of values, same order as qs
+        """
+        return sorted_quantiles(sorted(self.values), qs)
+
+
+def sorted_quantiles(values, qs):
+    """
+    Quantiles of sorted values with linear interpolation
+    :param values: sorted sequence of values
+    :param qs: iterable of quantiles in [0, 1]
+    :return: list of values, same order as qs
+    """
+    last = len(values) - 1
+    result = []
+    for q in qs:
+        position = last * q
+        low = int(position)
+        fraction = position - low
+        high = min(low + 1, last)
+        # for q = 0.5 it is the same as statistics.median
+        result.append(float(values[low] * (1 - fraction) + values[high] * fraction))
+    return result
+
+
+class LogHistogramQuantiles:
+    """
+    DDSketch-like histogram with logarithmic buckets.
+    Memory depends on range of values, not on their count,
+    any quantile is returned with relative error not more than relative_error
+    """
+    __slots__ = ('relative_error', 'gamma_log', 'buckets', 'zero_count')
+
+    def __init__(self, relative_error=0.01):
+        if not 0 < relative_error < 1:
+            raise ValueError(f'Relative error must be in (0, 1) - {relative_error}')
+        self.relative_error = relative_error
+        self.gamma_log = math.log((1 + relative_error) / (1 - relative_error))
+        self.buckets = {}
+        self.zero_count = 0
+
+    def add(self, value):
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self.gamma_log)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        if other.relative_error != self.relative_error:
+            raise ValueError('Can not merge histograms with different relative error')
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantiles(self, qs):
+        """
+        :param qs: iterable of quantiles in [0, 1]
+        :return: list of values, same order as qs
+        """
+        total = self.zero_count + sum(self.buckets.values())
+        gamma = math.exp(self.gamma_log)
+        bounds = []
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            bounds.append((seen, index))
+        result = []
+        for q in qs:
+            rank = q * (total - 1)
+            if rank < self.zero_count:
+                result.append(0.0)
+                continue
+            for seen, index in bounds:
+                if seen > rank:
+                    break
+            # middle of bucket (gamma^(i-1), gamma^i] in terms of relative error
+            result.append(2 * math.exp(index * self.gamma_log) / (gamma + 1))
+        return result
+
+
+QUANTILE_ESTIMATORS = {
+    'exact': ExactQuantiles,
+    'approx': LogHistogramQuantiles,
+}
+
+
+def quantile_estimator(name='exact', relative_error=0.01):
+    """
+    Factory for quantile estimators of every url
+    :param name: key of QUANTILE_ESTIMATORS
+    :param relative_error: allowed relative error for approximate estimators
+    :return: callable without arguments that creates new estimator
+    """
+    if name not in QUANTILE_ESTIMATORS:
+        raise ValueError(f'Unknown quantile estimator - {name}')
+    return partial(QUANTILE_ESTIMATORS[name], relative_error)
+
+
+class UrlStat:
+    """
+    Running statistics of request times for one url.
+    Sum is kept in integer milliseconds ($request_time has ms resolution),
+    so it does not depend on order in which times and parts of log are added
+    """
+    __slots__ = ('count', 'time_ms', 'time_max', 'quantiles')
+
+    def __init__(self, quantiles):
+        self.count = 0
+        self.time_ms = 0
+        self.time_max = float('-inf')
+        self.quantiles = quantiles
+
+    @property
+    def time_sum(self):
+        return self.time_ms / 1000
+
+    def add(self, time):
+        # request times are not negative, int() of x + 0.5 is rounding which is faster than round()
+        self.time_ms += int(time * 1000 + 0.5)
+        self.count += 1
+        if time > self.time_max:
+            self.time_max = time
+        self.quantiles.add(time)
+
+    def merge(self, other):
+        self.count += other.count
+        self.time_ms += other.time_ms
+        self.time_max = max(self.time_max, other.time_max)
+        self.quantiles.merge(other.quantiles)
+
+
+OTHER_URL = 'other'
+
+
+class UrlNormalizer:
+    """
+    Maps url from log to url of report, so urls which differ only by query or ids
+    are counted together. Result is cached for every url
+    """
+    ID_SEGMENT = re.compile(
+        r'(?<=/)(?:(?P<id>[0-9]+)'
+        r'|(?P<uuid>[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})'
+        r'|(?P<hex>(?=[0-9a-fA-F]*[0-9])(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{8,}))(?=/|$)'
     )
-    return log_info
+    QUERY_MODES = ('keep', 'strip', 'keys')
+
+    def __init__(self, query='keep', collapse_ids=False, rules=(), max_urls=0, cache_size=100000):
+        """
+        :param query: 'keep' query, 'strip' it or keep only sorted names of parameters - 'keys'
+        :param collapse_ids: replace numeric, hex and uuid path segments with {id}, {hex}, {uuid}
+        :param rules: list of (regex, replacement) applied to url one by one
+        :param max_urls: max count of urls in statistics, rest go to OTHER_URL, 0 - no limit
+        :param cache_size: max count of cached urls
+        """
+        if query not in self.QUERY_MODES:
+            raise ValueError(f'Unknown query mode - {query}')
+        self.query = query
+        self.collapse_ids = collapse_ids
+        self.rules = tuple(tuple(x) for x in rules)
+        self.max_urls = max_urls
+        self.cache_size = cache_size
+        self._compiled_rules = _compile_rules(self.rules)
+        self._cache = {}
+
+    def __getstate__(self):
+        # cache is not sent to other processes
+        return dict(self.__dict__, _cache={})
+
+    def __call__(self, url):
+        result = self._cache.get(url)
+        if result is None:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            result = self._cache[url] = self._normalize(url)
+        return result
+
+    def _normalize(self, url):
+        path, sep, query = url.partition('?')
+        if self.collapse_ids:
+            path = self.ID_SEGMENT.sub(lambda x: f'{{{x.lastgroup}}}', path)
+        if sep and self.query == 'keep':
+            path = f'{path}?{query}'
+        elif sep and self.query == 'keys':
+            path = f'{path}?' + '&'.join(sorted({x.partition("=")[0] for x in query.split('&') if x}))
+        for pattern, replacement in self._compiled_rules:
+            path = pattern.sub(replacement, path)
+        return path
+
+
+@lru_cache()
+def _compile_rules(rules):
+    return tuple((re.compile(pattern), replacement) for pattern, replacement in rules)
+
+
+def url_normalizer(config):
+    """
+    :param config: dict with config
+    :return: UrlNormalizer or None if urls are not changed by config
+    """
+    if (config['URL_QUERY'] == 'keep' and not config['URL_COLLAPSE_IDS']
+            and not config['URL_RULES'] and not config['MAX_URLS']):
+        return None
+    return UrlNormalizer(config['URL_QUERY'], config['URL_COLLAPSE_IDS'], config['URL_RULES'], config['MAX_URLS'])
+
+
+class LogStat:
+    """Per url statistics of the whole log, collected in one pass"""
+    __slots__ = ('urls', 'estimator', 'max_urls', 'request_count', 'line_count', 'error_count')
+
+    def __init__(self, estimator=ExactQuantiles, max_urls=0):
+        self.urls = {}
+        self.estimator = estimator
+        self.max_urls = max_urls
+        self.request_count = 0
+        self.line_count = 0
+        self.error_count = 0
+
+    @classmethod
+    def from_pairs(cls, log_data, estimator=ExactQuantiles):
+        """Build statistics from iterable of tuples - (url, time)"""
+        log_stat = cls(estimator)
+        for url, request_time in log_data:
+            # time which is not number raises TypeError as float sum of times did
+            log_stat.add(url, 0.0 + request_time)
+        return log_stat
+
+    def url_stat(self, url):
+        """Statistics of url, new urls over max_urls go to OTHER_URL"""
+        url_stat = self.urls.get(url)
+        if url_stat is None:
+            if self.max_urls and len(self.urls) >= self.max_urls and url != OTHER_URL:
+                return self.url_stat(OTHER_URL)
+            url_stat = self.urls[url] = UrlStat(self.estimator())
+        return url_stat
+
+    @property
+    def time_total(self):
+        return sum(x.time_ms for x in self.urls.values()) / 1000
+
+    def add(self, url, time):
+        self.url_stat(url).add(time)
+        self.request_count += 1
+
+    def merge(self, other):
+        for url, other_stat in other.urls.items():
+            self.url_stat(url).merge(other_stat)
+        self.request_count += other.request_count
+        self.line_count += other.line_count
+        self.error_count += other.error_count
+
+    def check_errors(self, max_errors):
+        check_errors(self.error_count, self.line_count, max_errors)
+
+
+def check_errors(error_count, line_count, max_errors):
+    """
+    Raise error if percent of uncorrect formatted strings more than max_errors
+    """
+    if error_count/line_count > max_errors:
+        raise RuntimeError(f'Too many parsing exceptions - {error_count/line_count}')
+
+
+class _ColumnAppender:
+    """Adds request times of one url to columns of ColumnarLogStat"""
+    __slots__ = ('code', 'codes', 'times')
+
+    def __init__(self, code, codes, times):
+        self.code = code
+        self.codes = codes
+        self.times = times
+
+    def add(self, time):
+        self.codes.append(self.code)
+        self.times.append(time)
+
+
+class _SegmentQuantiles:
+    """Exact quantiles of request times of one url from columns of ColumnarLogStat"""
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def quantiles(self, qs):
+        return sorted_quantiles(numpy.sort(self.values), qs)
+
+
+class ColumnarLogStat:
+    """
+    Statistics backend which keeps request times in typed columns with url codes.
+    Statistics of all urls are computed at once by summarize() - with numpy if it is installed.
+    Quantiles are always exact, estimator is not used
+    """
+    __slots__ = ('urls', 'url_list', 'codes', 'times', 'max_urls', 'request_count', 'line_count', 'error_count')
+
+    def __init__(self, estimator=None, max_urls=0):
+        self.urls = {}
+        self.url_list = []
+        self.codes = array('q')
+        self.times = array('d')
+        self.max_urls = max_urls
+        self.request_count = 0
+        self.line_count = 0
+        self.error_count = 0
+
+    def url_stat(self, url):
+        """Appender of times for url, new urls over max_urls go to OTHER_URL"""
+        appender = self.urls.get(url)
+        if appender is None:
+            if self.max_urls and len(self.urls) >= self.max_urls and url != OTHER_URL:
+                return self.url_stat(OTHER_URL)
+            appender = self.urls[url] = _ColumnAppender(len(self.url_list), self.codes, self.times)
+            self.url_list.append(url)
+        return appender
+
+    def add(self, url, time):
+        self.url_stat(url).add(time)
+        self.request_count += 1
+
+    def merge(self, other):
+        recode = [self.url_stat(url).code for url in other.url_list]
+        if numpy is not None and recode:
+            self.codes.frombytes(numpy.take(recode, numpy.frombuffer(other.codes, dtype=numpy.int64)).tobytes())
+        else:
+            self.codes.extend(recode[x] for x in other.codes)
+        self.times.extend(other.times)
+        self.request_count += other.request_count
+        self.line_count += other.line_count
+        self.error_count += other.error_count
+
+    def check_errors(self, max_errors):
+        check_errors(self.error_count, self.line_count, max_errors)
+
+    def __getstate__(self):
+        # appenders are bound to columns, they are created again after load
+        return {x: getattr(self, x) for x in self.__slots__ if x != 'urls'}
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+        self.urls = {url: _ColumnAppender(code, self.codes, self.times) for code, url in enumerate(self.url_list)}
+
+    def summarize(self):
+        """
+        :return: LogStat with count, time_sum, time_max and exact quantiles of every url
+        """
+        log_stat = LogStat(ExactQuantiles)
+        log_stat.request_count = self.request_count
+        log_stat.line_count = self.line_count
+        log_stat.error_count = self.error_count
+        if numpy is None or not self.codes:
+            for code, request_time in zip(self.codes, self.times):
+                log_stat.url_stat(self.url_list[code]).add(request_time)
+            return log_stat
+
+        codes = numpy.frombuffer(self.codes, dtype=numpy.int64)
+        # stable sort keeps order of times inside url
+        order = numpy.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        sorted_times = numpy.frombuffer(self.times, dtype=numpy.float64)[order]
+        starts = numpy.flatnonzero(numpy.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1])))
+        ends = numpy.append(starts[1:], len(sorted_codes))
+        # milliseconds are rounded like UrlStat does, integer sums do not depend on order
+        sums = numpy.add.reduceat((sorted_times * 1000 + 0.5).astype(numpy.int64), starts)
+        maxes = numpy.maximum.reduceat(sorted_times, starts)
+        for code, start, end, time_ms, time_max in zip(sorted_codes[starts].tolist(), starts.tolist(),
+                                                         ends.tolist(), sums.tolist(), maxes.tolist()):
+            url_stat = log_stat.urls[self.url_list[code]] = UrlStat(_SegmentQuantiles(sorted_times[start:end]))
+            url_stat.count = end - start
+            url_stat.time_ms = time_ms
+            url_stat.time_max = time_max
+        return log_stat
+
+
+STAT_BACKENDS = {
+    'python': LogStat,
+    'columnar': ColumnarLogStat,
+}
 
 
 def log_parse(line_iterator, max_errors):
@@ -91,50 +697,769 @@ def log_parse(line_iterator, max_errors):
             parsed_log.append((url, time))
         except Exception:
             current_errors += 1
-    if current_errors/line_count > max_errors:
-        raise RuntimeError(f'Too many parsing exceptions - {current_errors/line_count}')
+    check_errors(current_errors, line_count, max_errors)
     return parsed_log
 
 
+def log_aggregate(line_iterator, max_errors, estimator=ExactQuantiles, normalizer=None, backend=LogStat):
+    """
+    Parse lines from log straight into per url statistics.
+    Memory depends on count of distinct urls, not on count of lines
+    :param line_iterator: iterator with lines in format - '* * * * * * * url * * time'
+    :param max_errors: raise error if percent of uncorrect formatted strings more than this
+    :param estimator: factory of quantile estimators for every url
+    :param normalizer: UrlNormalizer or None to keep urls as is
+    :param backend: class of statistics - value of STAT_BACKENDS
+    :return: LogStat
+    """
+    log_stat = _aggregate_lines(line_iterator, estimator, normalizer, backend)
+    log_stat.check_errors(max_errors)
+    return log_stat
+
+
+def _new_stat(estimator, normalizer, backend=LogStat):
+    return backend(estimator, normalizer.max_urls if normalizer is not None else 0)
+
+
+def _aggregate_lines(line_iterator, estimator, normalizer=None, backend=LogStat):
+    log_stat = _new_stat(estimator, normalizer, backend)
+    for line in line_iterator:
+        log_stat.line_count += 1
+        try:
+            splitted = line.split(' ')
+            time = float(splitted[-1])
+            url = splitted[7]
+        except Exception:
+            log_stat.error_count += 1
+            continue
+        if normalizer is not None:
+            url = normalizer(url)
+        log_stat.add(url, time)
+    return log_stat
+
+
+def log_aggregate_bytes(line_iterator, max_errors, estimator=ExactQuantiles, normalizer=None, backend=LogStat):
+    """
+    log_aggregate for lines as bytes.
+    Only url and time fields are cut from line, url is decoded and normalized once for every distinct url
+    :param line_iterator: iterator with lines as bytes in format - '* * * * * * * url * * time'
+    :param max_errors: raise error if percent of uncorrect formatted strings more than this
+    :param estimator: factory of quantile estimators for every url
+    :param normalizer: UrlNormalizer or None to keep urls as is
+    :param backend: class of statistics - value of STAT_BACKENDS
+    :return: LogStat
+    """
+    log_stat = _aggregate_bytes_lines(line_iterator, estimator, normalizer, backend)
+    log_stat.check_errors(max_errors)
+    return log_stat
+
+
+# max count of raw urls which are remembered with their statistics
+RAW_URLS_CACHE_SIZE = 100000
+
+
+def _aggregate_bytes_lines(line_iterator, estimator, normalizer=None, backend=LogStat, log_stat=None):
+    if log_stat is None:
+        log_stat = _new_stat(estimator, normalizer, backend)
+    raw_urls = {}
+    for line in line_iterator:
+        log_stat.line_count += 1
+        try:
+            time = float(line[line.rfind(b' ') + 1:])
+            # url is 8th field, rest of line is not split
+            raw_url = line.split(b' ', 8)[7]
+        except Exception:
+            log_stat.error_count += 1
+            continue
+        url_stat = raw_urls.get(raw_url)
+        if url_stat is None:
+            if len(raw_urls) >= RAW_URLS_CACHE_SIZE:
+                raw_urls.clear()
+            url = raw_url.decode('utf-8')
+            if normalizer is not None:
+                url = normalizer(url)
+            url_stat = raw_urls[raw_url] = log_stat.url_stat(url)
+        url_stat.add(time)
+        log_stat.request_count += 1
+    return log_stat
+
+
+def _aggregate_block(block, estimator, normalizer=None, backend=LogStat):
+    # max_urls is applied only when parts are merged in order of file, part does not know urls before it
+    return _aggregate_bytes_lines(io.BytesIO(block), estimator, normalizer, backend, backend(estimator))
+
+
+def _aggregate_range(filename, start, end, estimator, normalizer=None, backend=LogStat):
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        return _aggregate_block(file.read(end - start), estimator, normalizer, backend)
+
+
+def chunk_ranges(filename, chunks):
+    """
+    Split plain file into byte ranges which start and end on line boundaries
+    :param filename: address of file
+    :param chunks: wanted count of ranges
+    :return: list of tuples - (start, end)
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as file:
+        for i in range(1, chunks):
+            position = size * i // chunks
+            if position <= bounds[-1]:
+                continue
+            file.seek(position - 1)
+            # line which contains position belongs to previous chunk
+            file.readline()
+            if file.tell() >= size:
+                break
+            if file.tell() > bounds[-1]:
+                bounds.append(file.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# external decompressors which are tried in "auto" mode, file name is added as last argument.
+# zcat is not here - inflate of gzip utility is slower than zlib in background thread
+GZIP_COMMANDS = [('pigz', '-dc')]
+
+
+@lru_cache(maxsize=8)
+def gzip_command(name='auto'):
+    """
+    Command for decompression of gzip files to stdout
+    :param name: "auto" - the first of GZIP_COMMANDS found on PATH, "python" - no command, or command line
+    :return: tuple of command arguments or None if gzip module must be used
+    """
+    if name == 'python':
+        return None
+    if name != 'auto':
+        return tuple(shlex.split(name))
+    for command in GZIP_COMMANDS:
+        if shutil.which(command[0]):
+            return command
+    return None
+
+
+def _command_blocks(command, filename, block_size):
+    """Output of decompression command by blocks, process is killed if blocks are not read to the end"""
+    # stderr goes to file - pipe which is not read while stdout is read may fill up and stop process
+    with tempfile.TemporaryFile() as error_file:
+        process = subprocess.Popen(list(command) + [filename], stdout=subprocess.PIPE, stderr=error_file)
+        completed = False
+        try:
+            yield from iter(partial(process.stdout.read, block_size), b'')
+            completed = True
+        finally:
+            if not completed:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+        error_file.seek(0)
+        error = error_file.read()
+    if process.returncode:
+        raise OSError(f'{command[0]} failed for {filename} - {error.decode(errors="replace").strip()}')
+
+
+def _gzip_module_blocks(filename, block_size):
+    with gzip.open(filename, 'rb') as file:
+        yield from iter(partial(file.read, block_size), b'')
+
+
+def gzip_blocks(filename, block_size=8 * 1024 * 1024, command=None):
+    """
+    Decompress gzip file into blocks of whole lines
+    :param filename: address of file
+    :param block_size: approximate size of block in bytes
+    :param command: external decompression command - result of gzip_command, gzip module if None
+    :return: iterator of bytes
+    """
+    if command is None:
+        blocks = _gzip_module_blocks(filename, block_size)
+    else:
+        blocks = _command_blocks(command, filename, block_size)
+    tail = b''
+    for data in blocks:
+        data = tail + data
+        line_end = data.rfind(b'\n') + 1
+        tail = data[line_end:]
+        if line_end:
+            yield data[:line_end]
+    if tail:
+        yield tail
+
+
+_END = object()
+
+
+def background_iter(iterator, depth=2):
+    """
+    Iterate in background thread, so producing of next items overlaps with work on current one.
+    Exception of iterator is raised in consumer, iterator is closed if consumer stops early
+    :param iterator: iterator of items
+    :param depth: max count of items produced in advance
+    :return: iterator of the same items
+    """
+    items = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                items.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except Exception as e:
+            put((None, e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, name='background_iter', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def gzip_file_iter(filename, command=None, block_size=1024 * 1024):
+    """
+    Lines of gzip file as bytes. File is decompressed by large blocks in background thread
+    (zlib and pipe reading release GIL), so decompression overlaps with parsing of lines
+    :param filename: address of file
+    :param command: external decompression command - result of gzip_command, gzip module if None
+    :param block_size: approximate size of decompressed block in bytes
+    :return: iterator of bytes
+    """
+    for block in background_iter(gzip_blocks(filename, block_size, command)):
+        yield from io.BytesIO(block)
+
+
+def parallel_aggregate(filename, max_errors, workers, estimator=ExactQuantiles, normalizer=None, backend=LogStat,
+                       gzip_cmd=None):
+    """
+    Parse log in several processes. Every process aggregates own part of log,
+    then partial statistics are merged in order of parts.
+    Parts are not limited by max_urls of normalizer, limit is applied while they are merged
+    Plain files are split into byte ranges, gzip files are decompressed here
+    and blocks of lines are sent to processes while next block is decompressed
+    :param filename: address of log file
+    :param max_errors: raise error if percent of uncorrect formatted strings more than this
+    :param workers: count of processes
+    :param estimator: factory of quantile estimators for every url
+    :param normalizer: UrlNormalizer or None to keep urls as is
+    :param backend: class of statistics - value of STAT_BACKENDS
+    :param gzip_cmd: external decompression command - result of gzip_command, gzip module if None
+    :return: LogStat
+    """
+    log_stat = _new_stat(estimator, normalizer, backend)
+    with ProcessPoolExecutor(workers) as executor:
+        if filename.endswith('.gz'):
+            pending = deque()
+            for block in gzip_blocks(filename, command=gzip_cmd):
+                # limit count of blocks in memory
+                if len(pending) >= workers * 2:
+                    log_stat.merge(pending.popleft().result())
+                pending.append(executor.submit(_aggregate_block, block, estimator, normalizer, backend))
+            while pending:
+                log_stat.merge(pending.popleft().result())
+        else:
+            parts = [executor.submit(_aggregate_range, filename, start, end, estimator, normalizer, backend)
+                     for start, end in chunk_ranges(filename, workers * 4)]
+            for part in parts:
+                log_stat.merge(part.result())
+    log_stat.check_errors(max_errors)
+    return log_stat
+
+
+class _LineReader:
+    """Lines of binary file, remembers offset after the last returned line"""
+
+    def __init__(self, file, offset, complete_only):
+        self.file = file
+        self.offset = offset
+        # last line of growing file can be written only partly
+        self.complete_only = complete_only
+        self.ended = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.ended:
+            raise StopIteration
+        line = self.file.readline()
+        if not line or self.complete_only and not line.endswith(b'\n'):
+            # partly written line is read next time from its start, rest of it may be written by then
+            if line:
+                self.file.seek(self.offset)
+            self.ended = True
+            raise StopIteration
+        self.offset += len(line)
+        return line
+
+
+def checkpoint_name(cache_dir, filename):
+    return f'{cache_dir}/checkpoint-{os.path.basename(filename)}.pickle'
+
+
+def _checkpoint_source(filename, config, follow):
+    file_stat = os.stat(filename)
+    if follow:
+        # growing file is the same while it is not rotated
+        source = (file_stat.st_dev, file_stat.st_ino)
+    else:
+        source = (file_stat.st_mtime_ns, file_stat.st_size)
+    return source + _aggregate_settings(config)
+
+
+def _load_checkpoint(name, source, size):
+    if not os.path.exists(name):
+        return None
+    try:
+        with open(name, 'rb') as checkpoint_file:
+            checkpoint = pickle.load(checkpoint_file)
+    except Exception as e:
+        logging.warning(f'Broken checkpoint {name} - {e}')
+        return None
+    # file which became shorter than offset was truncated
+    if checkpoint['source'] != source or checkpoint['offset'] > size:
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(name, source, offset, log_stat):
+    tmp_name = f'{name}.tmp'
+    with open(tmp_name, 'wb') as checkpoint_file:
+        pickle.dump({'source': source, 'offset': offset, 'stat': log_stat},
+                    checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_name, name)
+
+
+def checkpointed_aggregate(filename, config, follow=False):
+    """
+    Aggregate log and save offset with partial aggregate to CACHE_DIR
+    every CHECKPOINT_LINES lines, so interrupted run continues from the last checkpoint.
+    In follow mode log is growing file - only complete lines appended since last run are parsed,
+    checkpoint is kept to continue next time.
+    Every checkpoint contains the whole aggregate, with exact quantiles it keeps all times read so far,
+    so size of checkpoints grows with log and their writing takes time quadratic in count of lines
+    :param filename: address of log file
+    :param config: dict with config
+    :param follow: True for log which is still written
+    :return: LogStat for all lines from start of the file
+    """
+    estimator = quantile_estimator(config['QUANTILES'], config['QUANTILE_ERROR'])
+    normalizer = url_normalizer(config)
+    backend = STAT_BACKENDS[config['BACKEND']]
+    if config['QUANTILES'] == 'exact' or config['BACKEND'] == 'columnar':
+        logging.warning('Checkpoints keep all request times with exact quantiles, '
+                        'use QUANTILES "approx" or larger CHECKPOINT_LINES for big logs')
+    os.makedirs(config['CACHE_DIR'], exist_ok=True)
+    name = checkpoint_name(config['CACHE_DIR'], filename)
+    source = _checkpoint_source(filename, config, follow)
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as file:
+        # size of gzip content is unknown, its offset is checked by source
+        size = os.path.getsize(filename) if opener is open else float('inf')
+        checkpoint = _load_checkpoint(name, source, size)
+        if checkpoint is None:
+            offset, log_stat = 0, _new_stat(estimator, normalizer, backend)
+        else:
+            offset, log_stat = checkpoint['offset'], checkpoint['stat']
+            logging.info(f'Continue {filename} from offset {offset}')
+            # gzip file is decompressed to offset, but lines are not parsed again
+            file.seek(offset)
+        lines = _LineReader(file, offset, follow)
+        batch_size = config['CHECKPOINT_LINES'] or None
+        while True:
+            line_count = log_stat.line_count
+            # lines are added to statistics of the whole file, so max_urls sees urls in order of file
+            _aggregate_bytes_lines(islice(lines, batch_size), estimator, normalizer, backend, log_stat)
+            if log_stat.line_count == line_count:
+                break
+            _save_checkpoint(name, source, lines.offset, log_stat)
+            if batch_size is None:
+                break
+    if not follow:
+        # empty log has no checkpoint
+        with suppress(FileNotFoundError):
+            os.remove(name)
+    # nothing was written to live log yet
+    if log_stat.line_count:
+        log_stat.check_errors(config['MAX_ERRORS'])
+    return log_stat
+
+
+def aggregate_log_file(filename, config):
+    """
+    Aggregate log file in way which is chosen in config
+    :param filename: address of log file
+    :param config: dict with config
+    :return: LogStat
+    """
+    estimator = quantile_estimator(config['QUANTILES'], config['QUANTILE_ERROR'])
+    normalizer = url_normalizer(config)
+    backend = STAT_BACKENDS[config['BACKEND']]
+    with run_metrics.stage('aggregate') as stage:
+        stage.bytes_read = os.path.getsize(filename)
+        if config['WORKERS'] > 1:
+            if config['CHECKPOINT_LINES']:
+                logging.warning('CHECKPOINT_LINES is not used when WORKERS > 1')
+            log_stat = parallel_aggregate(filename, config['MAX_ERRORS'], config['WORKERS'], estimator, normalizer,
+                                          backend, gzip_command(config['GZIP_COMMAND']))
+        elif config['CHECKPOINT_LINES']:
+            log_stat = checkpointed_aggregate(filename, config)
+        elif filename.endswith('.gz'):
+            log_stat = log_aggregate_bytes(gzip_file_iter(filename, gzip_command(config['GZIP_COMMAND'])),
+                                           config['MAX_ERRORS'], estimator, normalizer, backend)
+        else:
+            log_stat = log_aggregate_bytes(mmap_file_iter(filename), config['MAX_ERRORS'], estimator, normalizer,
+                                           backend)
+        stage.lines = log_stat.line_count
+    return log_stat
+
+
+def aggregate_cache_name(cache_dir, date):
+    return f'{cache_dir}/aggregate-{date.strftime("%Y.%m.%d")}.pickle.gz'
+
+
+def _aggregate_settings(config):
+    # saved aggregates are valid only for the same estimator and urls normalization
+    return (config['QUANTILES'], config['QUANTILE_ERROR'], config['URL_QUERY'], config['URL_COLLAPSE_IDS'],
+            json.dumps(config['URL_RULES']), config['MAX_URLS'], config['BACKEND'])
+
+
+def _source_key(log_info, config):
+    file_stat = os.stat(log_info.file_path)
+    source = (os.path.basename(log_info.file_path), file_stat.st_mtime_ns, file_stat.st_size)
+    return source + _aggregate_settings(config)
+
+
+def load_aggregate(log_info, config):
+    """
+    Load saved aggregate of log
+    :param log_info: LogInfo of log
+    :param config: dict with config
+    :return: LogStat or None if there is no aggregate or log was changed
+    """
+    cache_name = aggregate_cache_name(config['CACHE_DIR'], log_info.date)
+    if not os.path.exists(cache_name):
+        return None
+    try:
+        with run_metrics.stage('load_aggregate') as stage, gzip.open(cache_name, 'rb') as cache_file:
+            stage.bytes_read = os.path.getsize(cache_name)
+            cached = pickle.load(cache_file)
+    except Exception as e:
+        logging.warning(f'Broken aggregate {cache_name} - {e}')
+        return None
+    if cached['source'] != _source_key(log_info, config):
+        return None
+    return cached['stat']
+
+
+def save_aggregate(log_info, config, log_stat):
+    """
+    Save aggregate of log to CACHE_DIR
+    :param log_info: LogInfo of log
+    :param config: dict with config
+    :param log_stat: LogStat of log
+    """
+    os.makedirs(config['CACHE_DIR'], exist_ok=True)
+    cache_name = aggregate_cache_name(config['CACHE_DIR'], log_info.date)
+    tmp_name = f'{cache_name}.tmp'
+    with run_metrics.stage('save_aggregate'), gzip.open(tmp_name, 'wb', compresslevel=6) as cache_file:
+        pickle.dump({'source': _source_key(log_info, config), 'stat': log_stat},
+                    cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    # readers never see half written file
+    os.replace(tmp_name, cache_name)
+
+
+def day_aggregate(log_info, config):
+    """
+    Aggregate of one log - saved one if log was not changed, parsed and saved otherwise
+    :param log_info: LogInfo of log
+    :param config: dict with config
+    :return: LogStat
+    """
+    log_stat = load_aggregate(log_info, config)
+    if log_stat is not None:
+        logging.info(f'Aggregate for {log_info.file_path} is loaded from cache')
+        return log_stat
+    log_stat = aggregate_log_file(log_info.file_path, config)
+    save_aggregate(log_info, config, log_stat)
+    return log_stat
+
+
+def range_aggregate(config, date_from, date_to):
+    """
+    Merge aggregates of all logs with date in [date_from, date_to],
+    only missing or changed logs are parsed
+    :param config: dict with config
+    :param date_from: first date
+    :param date_to: last date
+    :return: LogStat or None if there are no logs
+    """
+    log_files = {}
+    # plain log and its .gz may exist together while logrotate compresses it, one log is taken for date
+    for log_info in sorted(find_logs(config['LOG_DIR'])):
+        if date_from <= log_info.date <= date_to:
+            log_files.setdefault(log_info.date, log_info)
+    if not log_files:
+        return None
+    log_stat = _new_stat(quantile_estimator(config['QUANTILES'], config['QUANTILE_ERROR']), url_normalizer(config),
+                         STAT_BACKENDS[config['BACKEND']])
+    for log_info in sorted(log_files.values(), key=lambda x: x.date):
+        log_stat.merge(day_aggregate(log_info, config))
+    return log_stat
+
+
+def report_name(config, date):
+    return f'{config["REPORT_DIR"]}/report-{date.strftime("%Y.%m.%d")}.html'
+
+
+def day_report(log_info, config):
+    """
+    Create report for one log
+    :param log_info: LogInfo of log
+    :param config: dict with config
+    :return: name of report
+    """
+    name = report_name(config, log_info.date)
+    log_stat = day_aggregate(log_info, config)
+    report_create('./report.html', name, report_compute(log_stat, config['REPORT_SIZE']), config['REPORT_SIDECAR'])
+    return name
+
+
+def backfill(config):
+    """
+    Create reports for all logs in LOG_DIR which have no report, WORKERS logs are processed at once
+    :param config: dict with config
+    :return: list of created reports
+    """
+    log_files = {}
+    for log_info in find_logs(config['LOG_DIR']):
+        if not os.path.exists(report_name(config, log_info.date)):
+            log_files.setdefault(log_info.date, log_info)
+    if not log_files:
+        return []
+    logging.info(f'Backfill {len(log_files)} logs')
+    # every log is parsed in one process, parallel work is by logs
+    job_config = dict(config, WORKERS=1)
+    created = []
+    with ProcessPoolExecutor(config['WORKERS']) as executor:
+        jobs = {executor.submit(day_report, x, job_config): x for x in sorted(log_files.values())}
+        for job, log_info in jobs.items():
+            try:
+                created.append(job.result())
+            except Exception as e:
+                logging.error(f'Report for {log_info.file_path} failed - {e}')
+    return created
+
+
+def ready_logs(config, known_dates, signatures):
+    """
+    Logs which must be reported by daemon. Log is ready when its size and mtime
+    were not changed since previous call - logrotate may still write it
+    :param config: dict with config
+    :param known_dates: dates of logs which are already taken, ready ones are added
+    :param signatures: dict of file name - (size, mtime) from previous call, it is updated
+    :return: list of LogInfo
+    """
+    ready = []
+    for log_info in sorted(find_logs(config['LOG_DIR']), key=lambda x: x.date):
+        if log_info.date in known_dates:
+            continue
+        try:
+            file_stat = os.stat(log_info.file_path)
+        except FileNotFoundError:
+            continue
+        signature = (file_stat.st_size, file_stat.st_mtime_ns)
+        if signatures.get(log_info.file_path) != signature:
+            signatures[log_info.file_path] = signature
+            continue
+        del signatures[log_info.file_path]
+        known_dates.add(log_info.date)
+        if not os.path.exists(report_name(config, log_info.date)):
+            ready.append(log_info)
+    return ready
+
+
+async def _report_worker(jobs, config, executor):
+    loop = asyncio.get_running_loop()
+    while True:
+        log_info = await jobs.get()
+        if log_info is None:
+            return
+        logging.info(f'Report for {log_info.file_path} is started')
+        try:
+            name = await loop.run_in_executor(executor, day_report, log_info, config)
+        except Exception as e:
+            logging.error(f'Report for {log_info.file_path} failed - {e}')
+        else:
+            logging.info(f'Report {name} is ready')
+
+
+async def daemon(config, stop=None):
+    """
+    Watch LOG_DIR by polling every DAEMON_POLL_INTERVAL seconds and create report for every new log.
+    Last log is reported at start if it has no report. Logs are parsed in DAEMON_JOBS processes.
+    SIGTERM and SIGINT stop daemon - queued logs are dropped, running reports are finished
+    :param config: dict with config
+    :param stop: asyncio.Event which stops daemon, it is set by signals
+    """
+    loop = asyncio.get_running_loop()
+    stop = stop or asyncio.Event()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signal_number, stop.set)
+    # only logs which appear later are reported, as in one-shot run the last one is reported at start
+    last_log = get_last_log(config['LOG_DIR'])
+    known_dates = {x.date for x in find_logs(config['LOG_DIR']) if last_log is None or x.date != last_log.date}
+    signatures = {}
+    jobs = asyncio.Queue()
+    # every log is parsed in one process, parallel work is by logs
+    job_config = dict(config, WORKERS=1)
+    logging.info(f'Daemon is watching {config["LOG_DIR"]}')
+    with ProcessPoolExecutor(config['DAEMON_JOBS']) as executor:
+        workers = [loop.create_task(_report_worker(jobs, job_config, executor)) for _ in range(config['DAEMON_JOBS'])]
+        try:
+            while not stop.is_set():
+                for log_info in ready_logs(config, known_dates, signatures):
+                    jobs.put_nowait(log_info)
+                try:
+                    await asyncio.wait_for(stop.wait(), config['DAEMON_POLL_INTERVAL'])
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            logging.info('Daemon is stopping')
+            while not jobs.empty():
+                logging.info(f'Report for {jobs.get_nowait().file_path} is dropped')
+            for _ in workers:
+                jobs.put_nowait(None)
+            await asyncio.gather(*workers)
+            for signal_number in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(signal_number)
+
+
 def report_compute(log_data, report_size):
     """
-    Prepare values to report
-    :param log_data: List of tuples - (url, time)
+    Prepare values to report - report_size urls with max time_sum.
+    Urls are selected by heap over raw statistics, only selected ones are formatted
+    :param log_data: LogStat, ColumnarLogStat or list of tuples - (url, time)
     :param report_size: max urls in report
     :return: List of dicts for report
     """
-    request_count = len(log_data)
-    all_time = sum(x[1] for x in log_data)
+    if isinstance(log_data, ColumnarLogStat):
+        with run_metrics.stage('summarize'):
+            log_data = log_data.summarize()
+    elif not isinstance(log_data, LogStat):
+        log_data = LogStat.from_pairs(log_data)
+    request_count = log_data.request_count
+    all_time = log_data.time_total
     report_data = []
-    for url, group_iter in groupby(sorted(log_data), key=lambda x: x[0]):
-        time_data = [x[1] for x in group_iter]
-        report_data.append({
-            'url': url,
-            'count': len(time_data),
-            'count_perc': f'{len(time_data) / request_count:.3f}',
-            'time_sum': f'{sum(time_data):.3f}',
-            'time_perc': f'{sum(time_data) / all_time:.3f}',
-            'time_avg': f'{sum(time_data) / len(time_data):.3f}',
-            'time_max': f'{max(time_data):.3f}',
-            'time_med': f'{median(time_data):.3f}'
-        })
-    return sorted(report_data, key=lambda x: x['time_sum'], reverse=True)[:report_size]
-
-
-def report_create(template_name, result_name, report_data):
-    """
-    Creates report from template
+    with run_metrics.stage('report_compute'):
+        top_urls = heapq.nlargest(report_size, log_data.urls.items(), key=lambda x: x[1].time_ms)
+        for url, url_stat in top_urls:
+            time_med, time_p95, time_p99 = url_stat.quantiles.quantiles((0.5, 0.95, 0.99))
+            report_data.append({
+                'url': url,
+                'count': url_stat.count,
+                'count_perc': f'{url_stat.count / request_count:.3f}',
+                'time_sum': f'{url_stat.time_sum:.3f}',
+                'time_perc': f'{url_stat.time_sum / all_time:.3f}',
+                'time_avg': f'{url_stat.time_sum / url_stat.count:.3f}',
+                'time_max': f'{url_stat.time_max:.3f}',
+                'time_med': f'{time_med:.3f}',
+                'time_p95': f'{time_p95:.3f}',
+                'time_p99': f'{time_p99:.3f}'
+            })
+    return report_data
+
+
+@lru_cache(maxsize=8)
+def _template_parts(template_name, mtime_ns):
+    with open(template_name, 'rt') as template_file:
+        head, marker, tail = template_file.read().partition('$table_json')
+    if not marker:
+        raise ValueError(f'There is no $table_json in template {template_name}')
+    return Template(head), Template(tail)
+
+
+def load_template(template_name):
+    """
+    Template is read and parsed once while file is not changed
+    :param template_name: address of template file
+    :return: tuple of Templates - text before and after $table_json
+    """
+    return _template_parts(template_name, os.stat(template_name).st_mtime_ns)
+
+
+_row_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def _write_rows(file, report_data, escape_script=False):
+    """Write rows to file as compact JSON array one by one"""
+    file.write('[')
+    for index, row in enumerate(report_data):
+        if index:
+            file.write(',')
+        row_json = _row_encoder.encode(row)
+        # '</script>' in url must not close script tag with table
+        file.write(row_json.replace('</', '<\\/') if escape_script else row_json)
+    file.write(']')
+
+
+def report_create(template_name, result_name, report_data, sidecar=False):
+    """
+    Creates report from template, rows are written as compact JSON without building whole text
     :param template_name: address of template file
     :param result_name: address of result file
-    :param report_data: data for report
+    :param report_data: iterable of dicts - rows of report
+    :param sidecar: write rows to gzip JSON file next to report, page loads them from there
     """
-    with open(result_name, 'w') as result_file:
-        with open(template_name, 'rt') as template_file:
-            t = Template(template_file.read())
-            result_file.write(t.safe_substitute(table_json=report_data))
+    with run_metrics.stage('report_create'):
+        _report_write(template_name, result_name, report_data, sidecar)
     logging.info(f'Report created successfully - {result_name}')
 
 
+def _report_write(template_name, result_name, report_data, sidecar):
+    head, tail = load_template(template_name)
+    table_src = ''
+    if sidecar:
+        sidecar_name = f'{os.path.splitext(result_name)[0]}.json.gz'
+        with gzip.open(f'{sidecar_name}.tmp', 'wt', encoding='utf-8') as sidecar_file:
+            _write_rows(sidecar_file, report_data)
+        os.replace(f'{sidecar_name}.tmp', sidecar_name)
+        table_src = os.path.basename(sidecar_name)
+    # report is not seen as created until it is written completely
+    with open(f'{result_name}.tmp', 'w', encoding='utf-8') as result_file:
+        result_file.write(head.safe_substitute(table_src=table_src))
+        if sidecar:
+            result_file.write('null')
+        else:
+            _write_rows(result_file, report_data, escape_script=True)
+        result_file.write(tail.safe_substitute(table_src=table_src))
+    os.replace(f'{result_name}.tmp', result_name)
+
+
 def main():
     # Load config
     args = argparser.parse_args()
@@ -147,26 +1472,86 @@ def main():
 
     logging.info('Start')
 
-    log_file = get_last_log(config['LOG_DIR'])
+    timing = config['TIMING'] if args.timing is None else args.timing
+    metrics_file = args.metrics_file or config['METRICS_FILE']
+    profile_file = args.profile or config['PROFILE_FILE']
+    run_metrics.enabled = bool(timing or metrics_file)
+    profiler = cProfile.Profile() if profile_file else None
+    success = False
+    if profiler is not None:
+        profiler.enable()
+    try:
+        run(args, config)
+        success = True
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+            logging.info(f'Profile is saved to {profile_file}')
+        if timing:
+            run_metrics.log()
+        if metrics_file:
+            run_metrics.write_prometheus(metrics_file, success)
+    logging.info('End')
+
+
+def run(args, config):
+    """
+    Create reports which are chosen by command line arguments
+    :param args: parsed command line arguments
+    :param config: dict with config
+    """
+    if not os.path.exists(config["REPORT_DIR"]):
+        os.mkdir(config['REPORT_DIR'])
+
+    if args.date_from is not None:
+        date_to = args.date_to or args.date_from
+        log_stat = range_aggregate(config, args.date_from, date_to)
+        if log_stat is None:
+            logging.info(f'No logs found in {config["LOG_DIR"]} for dates range')
+            return
+        range_name = (f'{config["REPORT_DIR"]}/report-{args.date_from.strftime("%Y.%m.%d")}'
+                      f'-{date_to.strftime("%Y.%m.%d")}.html')
+        report_create('./report.html', range_name, report_compute(log_stat, config['REPORT_SIZE']),
+                      config['REPORT_SIDECAR'])
+        return
+
+    if args.daemon:
+        asyncio.run(daemon(config))
+        return
+
+    if args.backfill:
+        with run_metrics.stage('backfill'):
+            backfill(config)
+        return
+
+    if args.tail:
+        log_name = f'{config["LOG_DIR"]}/nginx-access-ui.log'
+        if not os.path.exists(log_name):
+            logging.info(f'No live log {log_name}')
+            return
+        log_stat = checkpointed_aggregate(log_name, config, follow=True)
+        report_create('./report.html', f'{config["REPORT_DIR"]}/report-live.html',
+                      report_compute(log_stat, config['REPORT_SIZE']), config['REPORT_SIDECAR'])
+        return
+
+    with run_metrics.stage('find_logs'):
+        log_file = get_last_log(config['LOG_DIR'])
     if log_file is None:
         logging.info(f'No log found in {config["LOG_DIR"]}')
         return
-    report_name = f'{config["REPORT_DIR"]}/report-{log_file.date.strftime("%Y.%m.%d")}.html'
-    if os.path.exists(report_name):
-        logging.info(f'Report {report_name} already exists!')
+    if os.path.exists(report_name(config, log_file.date)):
+        logging.info(f'Report {report_name(config, log_file.date)} already exists!')
         return
 
-    if not os.path.exists(config["REPORT_DIR"]):
-        os.mkdir(config['REPORT_DIR'])
-
-    parsed_log = log_parse(file_iter(log_file.file_path), config['MAX_ERRORS'])
-    report_data = report_compute(parsed_log, config['REPORT_SIZE'])
-    report_create('./report.html', report_name, report_data)
-    logging.info('End')
+    day_report(log_file, config)
 
 
 if __name__ == "__main__":
+    # saved aggregates and checkpoints pickle classes of log_analyzer module, not of __main__,
+    # so they can be loaded by other programs which import it
+    import log_analyzer
     try:
-        main()
+        log_analyzer.main()
     except Exception as e:
         logging.exception(e)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of log_analyzer pipeline on generated ui_short logs.
+
+    python log_analyzer_bench.py --lines 1000000 --urls 50000 --output bench.json
+    python log_analyzer_bench.py --lines 1000000 --compare bench.json
+
+Every stage runs in its own process, so peak RSS of stage does not depend on other stages.
+"""
+import argparse
+import bisect
+import gzip
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import log_analyzer
+
+argparser = argparse.ArgumentParser(description='Benchmark of log_analyzer stages')
+argparser.add_argument('--lines', type=int, default=200000, help='Count of lines in generated log')
+argparser.add_argument('--urls', type=int, default=10000, help='Count of distinct urls')
+argparser.add_argument('--errors', type=float, default=0.01, help='Part of malformed lines')
+argparser.add_argument('--times', choices=['lognormal', 'exponential', 'uniform'], default='lognormal',
+                       help='Distribution of request times')
+argparser.add_argument('--seed', type=int, default=1)
+argparser.add_argument('--formats', default='plain,gzip', help='Comma separated formats of log - plain, gzip')
+argparser.add_argument('--config', help='log_analyzer config to benchmark, default config if not set')
+argparser.add_argument('--dir', help='Folder for generated logs, temporary folder if not set')
+argparser.add_argument('--output', help='Save results to JSON file')
+argparser.add_argument('--compare', help='Compare results with saved JSON file')
+
+LINE = ('{ip} -  - [{date}] "{method} {url} HTTP/1.1" {status} {size} "-" "{agent}" "-" '
+        '"{request_id}" "{user}" {time:.3f}\n')
+AGENTS = [
+    'Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5',
+    'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/59.0.3071.115 Safari/537.36',
+    'python-requests/2.13.0',
+    '-',
+]
+URL_TEMPLATES = [
+    '/api/v2/banner/{id}',
+    '/api/v2/group/{id}/statistic/sites/?date_type=day&date_from=2017-06-28&date_to=2017-06-28',
+    '/api/1/photo/{id}/',
+    '/api/v2/slot/{id}/groups',
+    '/export/appinstall_raw/2017-06-{day:02d}/',
+    '/accounts/login/?next=/campaigns/{id}/',
+]
+STAGES = ['file_iter', 'log_parse', 'aggregate', 'report_compute', 'report_create']
+
+
+def request_times(distribution, rnd):
+    if distribution == 'lognormal':
+        return lambda: rnd.lognormvariate(-2, 1)
+    if distribution == 'exponential':
+        return lambda: rnd.expovariate(5)
+    return lambda: rnd.uniform(0, 1)
+
+
+def generate_log(filename, lines, urls, errors, times, seed):
+    """
+    Write log in ui_short format
+    :param filename: address of log, gzip if it ends with .gz
+    :param lines: count of lines
+    :param urls: count of distinct urls, popularity of urls is Zipf-like
+    :param errors: part of malformed lines
+    :param times: distribution of request times - lognormal, exponential, uniform
+    :param seed: seed of random generator
+    """
+    rnd = random.Random(seed)
+    url_list = [rnd.choice(URL_TEMPLATES).format(id=rnd.randint(1, 10 ** 8), day=rnd.randint(1, 30))
+                for _ in range(urls)]
+    cum_weights = list(itertools.accumulate(1 / (x + 1) for x in range(urls)))
+    next_time = request_times(times, rnd)
+    start = datetime(2017, 6, 29, 3, 50, 22)
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'wt', encoding='utf-8') as log_file:
+        for index in range(lines):
+            if rnd.random() < errors:
+                log_file.write(rnd.choice(['-\n', 'broken line without fields\n', LINE[:40] + '\n']))
+                continue
+            url = url_list[bisect.bisect_left(cum_weights, rnd.random() * cum_weights[-1])]
+            log_file.write(LINE.format(
+                ip=f'1.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}',
+                date=(start + timedelta(seconds=index // 100)).strftime('%d/%b/%Y:%H:%M:%S +0300'),
+                method=rnd.choice(['GET', 'GET', 'GET', 'POST']),
+                url=url,
+                status=rnd.choice([200, 200, 200, 404, 500]),
+                size=rnd.randint(0, 100000),
+                agent=rnd.choice(AGENTS),
+                request_id=f'{1498697422 + index}-{rnd.randint(10 ** 9, 10 ** 10)}-4708-{index}',
+                user=f'{rnd.getrandbits(36):x}',
+                time=next_time(),
+            ))
+
+
+def _peak_rss_kb():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_stage(stage, filename, config, connection):
+    """Run stage in child process and send its measures to parent"""
+    template = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report.html')
+    log_stat = report_data = None
+    if stage in ('report_compute', 'report_create'):
+        log_stat = log_analyzer.aggregate_log_file(filename, config)
+    if stage == 'report_create':
+        report_data = log_analyzer.report_compute(log_stat, config['REPORT_SIZE'])
+    rss_before = _peak_rss_kb()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    if stage == 'file_iter':
+        for _ in log_analyzer.file_iter(filename):
+            pass
+    elif stage == 'log_parse':
+        log_analyzer.log_parse(log_analyzer.file_iter(filename), config['MAX_ERRORS'])
+    elif stage == 'aggregate':
+        log_analyzer.aggregate_log_file(filename, config)
+    elif stage == 'report_compute':
+        log_analyzer.report_compute(log_stat, config['REPORT_SIZE'])
+    else:
+        with tempfile.TemporaryDirectory() as report_dir:
+            log_analyzer.report_create(template, f'{report_dir}/report.html', report_data, config['REPORT_SIDECAR'])
+    connection.send({
+        'seconds': time.perf_counter() - started,
+        'cpu_seconds': time.process_time() - cpu_started,
+        'rss_before_kb': rss_before,
+        'peak_rss_kb': _peak_rss_kb(),
+    })
+    connection.close()
+
+
+def run_stage(stage, filename, config, lines):
+    """
+    Measure one stage in separate process
+    :return: dict with time, lines per second and peak RSS of stage
+    """
+    parent, child = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_stage, args=(stage, filename, config, child))
+    process.start()
+    child.close()
+    result = parent.recv()
+    process.join()
+    result['lines_per_sec'] = lines / result['seconds'] if result['seconds'] else None
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, saved):
+    """Print ratio of time of every stage to saved results"""
+    old = {(x['format'], x['stage']): x for x in saved['results']}
+    print(f'compare with {saved.get("commit")} ({saved.get("created")})')
+    for result in results:
+        previous = old.get((result['format'], result['stage']))
+        if previous is None:
+            continue
+        ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else float('inf')
+        print(f'{result["format"]:6} {result["stage"]:15} {previous["seconds"]:9.3f}s -> {result["seconds"]:9.3f}s'
+              f' x{ratio:.2f}' + ('  REGRESSION' if ratio > 1.1 else ''))
+
+
+def main():
+    args = argparser.parse_args()
+    config = log_analyzer.parse_config(args.config) if args.config else dict(log_analyzer.DEFAULT_CONFIG)
+    params = {
+        'lines': args.lines,
+        'urls': args.urls,
+        'errors': args.errors,
+        'times': args.times,
+        'seed': args.seed,
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_dir = args.dir or tmp_dir
+        config['CACHE_DIR'] = f'{tmp_dir}/cache'
+        for log_format in args.formats.split(','):
+            suffix = '.gz' if log_format == 'gzip' else ''
+            filename = f'{log_dir}/nginx-access-ui.log-bench-{args.lines}-{args.urls}-{args.seed}{suffix}'
+            if not os.path.exists(filename):
+                generate_log(filename, args.lines, args.urls, args.errors, args.times, args.seed)
+            for stage in STAGES:
+                result = dict(format=log_format, stage=stage, **run_stage(stage, filename, config, args.lines))
+                print(f'{log_format:6} {stage:15} {result["seconds"]:9.3f}s'
+                      f' {result["lines_per_sec"] or 0:12.0f} lines/s peak RSS {result["peak_rss_kb"] / 1024:8.1f} MB')
+                results.append(result)
+    report = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': params,
+        'config': config,
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as saved_file:
+            compare(results, json.load(saved_file))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,33 +28,21 @@
 # Вам наверняка пригодится itertools.
 # Можно свободно определять свои функции и т.п.
 # -----------------
-from itertools import groupby, combinations, product, chain
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import combinations, combinations_with_replacement, product, islice
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 def hand_rank(hand):
-    """Возвращает значение определяющее ранг 'руки'"""
-    ranks = card_ranks(hand)
-    if straight(ranks) and flush(hand):
-        return 8, max(ranks)
-    if kind(4, ranks):
-        # Need to save paired rank no ignore it next time
-        trin = kind(4, ranks)
-        return 7, trin, kind(1, ranks, [trin])
-    if kind(3, ranks):
-        # Need to save paired rank no ignore it next time
-        trin = kind(3, ranks)
-        return 6, trin, kind(2, ranks, [trin])
-    if flush(hand):
-        return 5, ranks
-    if straight(ranks):
-        return 4, max(ranks)
-    if kind(3, ranks):
-        return 3, kind(3, ranks), ranks
-    if two_pair(ranks):
-        return 2, two_pair(ranks), ranks
-    if kind(2, ranks):
-        return 1, kind(2, ranks), ranks
-    return 0, ranks
+    """Возвращает значение определяющее ранг 'руки' - целое число, чем больше, тем сильнее рука"""
+    return cached_rank(encode_hand(hand))
 
 
 # Ранги: 2, 3, 4, 5, 6, 7, 8, 9,
@@ -69,118 +57,693 @@ _sort_dict = {
 }
 
 
-def card_ranks(hand):
-    """Возвращает список рангов (его числовой эквивалент),
-    отсортированный от большего к меньшему"""
-    return [_sort_dict[x[0]]
-            for x in sorted(hand, key=lambda elem: _sort_dict[elem[0]])]
+# Внутреннее представление: карта - номер бита 13 * масть + (ранг - 2),
+# рука - целое число с битами своих карт, т.е. 4 маски мастей по 13 бит.
+# Строки переводятся в маски только на входе и выходе best_hand и best_wild_hand.
+SUITS = 'CSHD'
+CARD_CODES = {rank + suit: suit_index * 13 + rank_index
+              for suit_index, suit in enumerate(SUITS) for rank_index, rank in enumerate(_sort_dict)}
+CARD_NAMES = {code: name for name, code in CARD_CODES.items()}
+_SUIT_BITS = 0x1FFF
+_WHEEL = 0b1000000001111
+# джокер заменяет карту своего цвета: черный - трефы и пики, красный - червы и бубны
+_JOKER_SUITS = {'?B': 'CS', '?R': 'HD'}
+JOKERS = {joker: [CARD_CODES[rank + suit] for rank in _sort_dict for suit in suits]
+          for joker, suits in _JOKER_SUITS.items()}
+
 
+def encode_hand(hand):
+    """Маска карт руки из строк"""
+    mask = 0
+    for card in hand:
+        mask |= 1 << CARD_CODES[card]
+    return mask
 
-def flush(hand):
-    """Возвращает True, если все карты одной масти"""
-    return all(x[1] == hand[0][1] for x in hand)
 
+def decode_hand(mask):
+    """Список карт маски в порядке кодов"""
+    return [CARD_NAMES[code] for code in range(52) if mask >> code & 1]
 
-def straight(ranks):
+
+def _rank_levels(mask):
     """
-    Возвращает True, если отсортированные ранги
-    формируют последовательность 5ти,
-    где у 5ти карт ранги идут по порядку (стрит)
+    Гистограмма рангов битовыми операциями: маски рангов,
+    которые встречаются хотя бы 1, 2, 3 и 4 раза
     """
-    return all(ranks[x] + 1 == ranks[x+1] for x in range(len(ranks)-1))
+    s0, s1, s2, s3 = mask & _SUIT_BITS, mask >> 13 & _SUIT_BITS, mask >> 26 & _SUIT_BITS, mask >> 39
+    low, high = s0 & s1, s2 & s3
+    return (s0 | s1 | s2 | s3,
+            low | high | (s0 | s1) & (s2 | s3),
+            low & (s2 | s3) | high & (s0 | s1),
+            low & high)
+
+
+def _straight_high(ranks_mask):
+    """Старший ранг стрита в маске рангов или 0"""
+    run = ranks_mask & ranks_mask >> 1 & ranks_mask >> 2 & ranks_mask >> 3 & ranks_mask >> 4
+    if run:
+        return run.bit_length() + 5
+    return 5 if ranks_mask & _WHEEL == _WHEEL else 0
+
+
+def _descending(ranks_mask):
+    """Ранги маски от старшего, туз - 13, двойка - 1"""
+    return [rank + 1 for rank in range(12, -1, -1) if ranks_mask >> rank & 1]
+
+
+def _rank_key(category, ranks):
+    """Целый ключ: категория и ранги для сравнения равных категорий по 4 бита"""
+    key = category << 20
+    for index, rank in enumerate(ranks):
+        key |= rank << 16 - 4 * index
+    return key
+
+
+def mask_rank(mask):
+    """hand_rank для маски из 5ти карт"""
+    any_, pairs, trips, quads = _rank_levels(mask)
+    if not pairs:
+        high = _straight_high(any_)
+        is_flush = any_ in (mask & _SUIT_BITS, mask >> 13 & _SUIT_BITS, mask >> 26 & _SUIT_BITS, mask >> 39)
+        if high:
+            return _rank_key(8 if is_flush else 4, [high - 1])
+        return _rank_key(5 if is_flush else 0, _descending(any_))
+    if quads:
+        return _rank_key(7, [quads.bit_length(), (any_ & ~quads).bit_length()])
+    if trips:
+        if pairs & ~trips:
+            return _rank_key(6, [trips.bit_length(), (pairs & ~trips).bit_length()])
+        return _rank_key(3, [trips.bit_length()] + _descending(any_ & ~trips))
+    if pairs & pairs - 1:
+        low_pair = pairs & ~(1 << pairs.bit_length() - 1)
+        return _rank_key(2, [pairs.bit_length(), low_pair.bit_length(), (any_ & ~pairs).bit_length()])
+    return _rank_key(1, [pairs.bit_length()] + _descending(any_ & ~pairs))
+
+
+# Ранг не зависит от перестановки мастей, поэтому кэш хранит ранги
+# канонических рук - с масками мастей, отсортированными по убыванию
+RANK_CACHE_SIZE = 2 ** 17
+
+
+def canonical_mask(mask):
+    """Маска руки, одинаковая для всех рук, отличающихся только перестановкой мастей"""
+    s0, s1, s2, s3 = sorted((mask & _SUIT_BITS, mask >> 13 & _SUIT_BITS, mask >> 26 & _SUIT_BITS, mask >> 39))
+    return s3 | s2 << 13 | s1 << 26 | s0 << 39
+
 
+@lru_cache(maxsize=RANK_CACHE_SIZE)
+def _canonical_rank(mask):
+    return mask_rank(mask)
 
-def kind(n, ranks, ignore_list=None):
-    """Возвращает первый ранг, который n раз встречается в данной руке.
-    Возвращает None, если ничего не найдено"""
-    if ignore_list is None:
-        ignore_list = []
-    for key, group in groupby(ranks):
-        if sum(1 for x in group) >= n and key not in ignore_list:
-            return key
-    return None
 
+def cached_rank(mask):
+    """mask_rank через LRU кэш канонических рук"""
+    return _canonical_rank(canonical_mask(mask))
 
-def two_pair(ranks):
-    """Если есть две пары, то возврщает два соответствующих ранга,
-    иначе возвращает None"""
-    f_key = None
-    s_key = None
-    for key, group in groupby(ranks):
-        if sum(1 for x in group) >= 2:
-            if f_key is None:
-                f_key = key
-            else:
-                s_key = key
-    return (f_key, s_key) if s_key is not None else None
+
+def rank_cache_info():
+    """
+    Статистика кэша рангов для подбора RANK_CACHE_SIZE
+    :return: dict с hits, misses, maxsize, currsize и hit_rate
+    """
+    info = _canonical_rank.cache_info()._asdict()
+    calls = info['hits'] + info['misses']
+    info['hit_rate'] = info['hits'] / calls if calls else 0.0
+    return info
+
+
+def rank_cache_clear():
+    _canonical_rank.cache_clear()
 
 
 def best_hand_of_list(hands_list):
-    """Search best hand from list"""
-    result = None
-    result_hand = None
-    for hand, hand_result in [(x, hand_rank(x)) for x in hands_list]:
-        if result is None or result[0] < hand_result[0]:
-            result_hand, result = hand, hand_result
-        elif result[0] == hand_result[0]:
-            for tindex in range(len(result)):
-                if hand_result[tindex] is None or result[tindex] > hand_result[tindex]:
-                    break
-                if result[tindex] < hand_result[tindex]:
-                    result_hand, result = hand, hand_result
-                    break
-    return result_hand
-
-
-def best_hand(hand):
+    """Search best hand from list - first hand with max hand_rank or None for empty list"""
+    return max(hands_list, key=hand_rank, default=None)
+
+
+def _levels_key(levels):
+    any_, pairs, trips, quads = levels
+    return any_ | pairs << 13 | trips << 26 | quads << 39
+
+
+@lru_cache(maxsize=None)
+def _tables():
+    """
+    Таблицы для рук из 5, 6 и 7 карт, строятся один раз при первом вызове.
+    Значение - (сила, ранги лучших 5ти карт), сила - номер класса руки
+    в порядке hand_rank среди всех 7462 классов, поэтому сравнение сил
+    совпадает со сравнением hand_rank.
+    :return: таблица по гистограмме рангов, таблица флешей по маске рангов масти
+    """
+    by_levels, by_suit = {}, {}
+    classes = []
+    for ranks in combinations_with_replacement(range(13), 5):
+        counts = Counter(ranks)
+        if max(counts.values()) > 4:
+            continue
+        # масти выбираются так, чтобы не было флеша
+        mask = sum(1 << 13 * (index % 4) + rank for index, rank in enumerate(ranks))
+        classes.append((mask_rank(mask), by_levels, _levels_key(_rank_levels(mask)), ranks))
+        if len(counts) == 5:
+            mask = sum(1 << rank for rank in ranks)
+            classes.append((mask_rank(mask), by_suit, mask, ranks))
+    classes.sort(key=lambda x: x[0])
+    strength, previous = -1, None
+    for key, table, index, ranks in classes:
+        if key != previous:
+            strength, previous = strength + 1, key
+        table[index] = (strength, ranks)
+    # лучшие 5 карт из n лежат среди n-1 карт без одной из них
+    for size in (6, 7):
+        for ranks in combinations_with_replacement(range(13), size):
+            counts = Counter(ranks)
+            if max(counts.values()) > 4:
+                continue
+            by_levels[_counts_key(counts)] = max(by_levels[_counts_key(counts - Counter([x]))] for x in counts)
+            if len(counts) == size:
+                mask = sum(1 << rank for rank in ranks)
+                by_suit[mask] = max(by_suit[mask & ~(1 << x)] for x in ranks)
+    return by_levels, by_suit
+
+
+def _counts_key(counts):
+    return sum(1 << 13 * level + rank for rank, count in counts.items() for level in range(count))
+
+
+def mask_strength(mask):
+    """
+    Оценка маски из 5-7 карт по таблицам
+    :return: сила лучшей руки из 5ти карт (чем больше, тем лучше),
+    ранги её карт (0 - двойка) и масть флеша или None
+    """
+    by_levels, by_suit = _tables()
+    # флеш из 7ми карт всегда сильнее каре и фулл-хауса
+    for suit in range(4):
+        value = by_suit.get(mask >> 13 * suit & _SUIT_BITS)
+        if value is not None:
+            return value[0], value[1], suit
+    value = by_levels[_levels_key(_rank_levels(mask))]
+    return value[0], value[1], None
+
+
+def _best_mask(mask):
+    """Сила и маска лучших 5ти карт из маски"""
+    strength, ranks, suit = mask_strength(mask)
+    if suit is not None:
+        return strength, sum(1 << 13 * suit + rank for rank in ranks)
+    used = 0
+    for rank in ranks:
+        bit = 1 << rank
+        while not mask & bit or used & bit:
+            bit <<= 13
+        used |= bit
+    return strength, used
+
+
+def hand_strength(hand):
+    """Сила лучшей руки из 5ти карт в руке из 5-7 карт, чем больше, тем лучше"""
+    return mask_strength(encode_hand(hand))[0]
+
+
+def best_hand_table(hand):
+    """best_hand по таблицам: лучшая рука находится несколькими поисками в словарях"""
+    used = _best_mask(encode_hand(hand))[1]
+    return tuple(card for card in hand if used >> CARD_CODES[card] & 1)
+
+
+def _best_combination(masks):
+    """Номера 5ти карт с максимальным mask_rank, первые из равных"""
+    result, result_rank = None, None
+    for indexes in combinations(range(len(masks)), 5):
+        rank = cached_rank(masks[indexes[0]] | masks[indexes[1]] | masks[indexes[2]] | masks[indexes[3]]
+                           | masks[indexes[4]])
+        if result is None or rank > result_rank:
+            result, result_rank = indexes, rank
+    return result, result_rank
+
+
+def best_hand_combinations(hand):
+    """best_hand перебором всех комбинаций из 5ти карт"""
+    indexes, _ = _best_combination([1 << CARD_CODES[card] for card in hand])
+    return tuple(hand[x] for x in indexes)
+
+
+BEST_HAND_BACKENDS = {
+    'table': best_hand_table,
+    'combinations': best_hand_combinations,
+}
+
+
+def best_hand(hand, backend='table'):
     """Из "руки" в 7 карт возвращает лучшую "руку" в 5 карт """
-    return best_hand_of_list(combinations(hand, 5))
+    return BEST_HAND_BACKENDS[backend](hand)
 
 
-def best_wild_hand(hand):
-    """best_hand но с джокерами"""
-    all_possible_hands = [hand]
-    jokers = [
-        ('?B', [x[0]+x[1] for x in product(_sort_dict.keys(), ['C', 'S'])]),
-        ('?R', [x[0]+x[1] for x in product(_sort_dict.keys(), ['H', 'D'])])
-    ]
-    # change all jokers
+def best_wild_hand_combinations(hand):
+    """best_wild_hand перебором всех замен джокеров и всех комбинаций из 5ти карт"""
+    masks = [1 << CARD_CODES[card] if card not in JOKERS else 0 for card in hand]
+    taken = sum(masks)
+    jokers = [index for index, card in enumerate(hand) if card in JOKERS]
+    # каждый джокер заменяется картой своего цвета, которой нет в руке
+    replacements = product(*[[1 << x for x in JOKERS[hand[index]] if not taken >> x & 1] for index in jokers])
+    result, result_rank = None, None
+    for replacement in replacements:
+        if len(set(replacement)) < len(replacement):
+            continue
+        for index, mask in zip(jokers, replacement):
+            masks[index] = mask
+        indexes, rank = _best_combination(masks)
+        if result is None or rank > result_rank:
+            result, result_rank = [masks[x] for x in indexes], rank
+    return tuple(CARD_NAMES[x.bit_length() - 1] for x in result)
+
+
+# окна стритов в номерах рангов от старшего, A-2-3-4-5 последний
+_STRAIGHT_WINDOWS = [list(range(high, high - 5, -1)) for high in range(12, 3, -1)] + [[3, 2, 1, 0, 12]]
+
+
+def _joker_ranks(counts, free, jokers):
+    """
+    Ранги, которые стоит пробовать для каждого джокера: ранги карт руки (каре, фулл-хаус, пары),
+    недостающие ранги стритов, и два старших новых ранга - кикеры или пара из двух джокеров.
+    Остальные новые ранги дают ту же комбинацию с меньшими кикерами
+    """
+    useful = {rank for rank in range(13) if counts[rank]}
+    for window in _STRAIGHT_WINDOWS:
+        missing = [rank for rank in window if not counts[rank]]
+        if len(missing) <= len(jokers):
+            useful.update(missing)
+    result = []
     for joker in jokers:
-        # if joker in first, then we have it in all
-        if joker[0] in all_possible_hands[0]:
-            # create all combinations (hand, joker_value) and replace joker
-            all_possible_hands = [
-                [y if y != joker[0] else x[1] for y in x[0]]
-                for x in product(all_possible_hands, joker[1]) if x[1] not in x[0]
-            ]
-    # create all 5-combinations from all "joker"-combinations
-    return best_hand_of_list(
-        chain.from_iterable(combinations(x, 5) for x in all_possible_hands)
-    )
+        new = [rank for rank in range(12, -1, -1) if not counts[rank] and free[joker][rank]][:2]
+        result.append(sorted({rank for rank in useful if free[joker][rank]}.union(new), reverse=True))
+    return result
+
+
+def _rank_keys(key, counts, free, jokers, choices, ranks=()):
+    """Ключи гистограмм рангов для всех замен джокеров рангами из choices"""
+    if len(ranks) == len(choices):
+        yield key, ranks
+        return
+    joker = jokers[len(ranks)]
+    for rank in choices[len(ranks)]:
+        # одинаковые джокеры не могут взять больше карт ранга, чем их свободно
+        same = sum(1 for index, other in enumerate(ranks) if other == rank and jokers[index] == joker)
+        if same >= free[joker][rank]:
+            continue
+        level = counts[rank] + ranks.count(rank)
+        yield from _rank_keys(key | 1 << 13 * level + rank, counts, free, jokers, choices, ranks + (rank,))
+
+
+def _wild_candidates(base, jokers):
+    """
+    Лучшая замена джокеров: сначала флеши - все джокеры подходящего цвета
+    идут в масть флеша, затем руки без флеша, где важны только ранги джокеров.
+    Руки без флеша не перебираются, если они не могут быть сильнее найденного флеша
+    :param base: маска карт без джокеров
+    :param jokers: список джокеров
+    :return: сила и коды карт, которыми заменены джокеры
+    """
+    by_levels, by_suit = _tables()
+    best, best_codes = -1, None
+    for suit in range(4):
+        suit_mask = base >> 13 * suit & _SUIT_BITS
+        able = [index for index, joker in enumerate(jokers) if SUITS[suit] in _JOKER_SUITS[joker]]
+        if bin(suit_mask).count('1') + len(able) < 5:
+            continue
+        others = {index: next(x for x in JOKERS[jokers[index]] if not base >> x & 1)
+                  for index in range(len(jokers)) if index not in able}
+        for ranks in combinations([x for x in range(13) if not suit_mask >> x & 1], len(able)):
+            strength = by_suit[suit_mask | sum(1 << x for x in ranks)][0]
+            if strength > best:
+                codes = {**others, **{index: 13 * suit + rank for index, rank in zip(able, ranks)}}
+                best, best_codes = strength, [codes[x] for x in range(len(jokers))]
+    counts = [bin(base >> rank & 0x8004002001).count('1') for rank in range(13)]
+    top = sorted(counts, reverse=True)
+    # без флеша сильнее флеша только каре и фулл-хаус
+    if best >= 0 and top[0] + len(jokers) < 4 and top[0] + top[1] + len(jokers) < 5:
+        return best, best_codes
+    free = {}
+    for joker in set(jokers):
+        first, second = (~base >> 13 * SUITS.index(x) & _SUIT_BITS for x in _JOKER_SUITS[joker])
+        free[joker] = [(first >> rank & 1) + (second >> rank & 1) for rank in range(13)]
+    choices = _joker_ranks(counts, free, jokers)
+    for key, ranks in _rank_keys(_levels_key(_rank_levels(base)), counts, free, jokers, choices):
+        strength = by_levels[key][0]
+        if strength > best:
+            codes, taken = [], base
+            for joker, rank in zip(jokers, ranks):
+                code = next(x for x in JOKERS[joker] if x % 13 == rank and not taken >> x & 1)
+                codes.append(code)
+                taken |= 1 << code
+            best, best_codes = strength, codes
+    return best, best_codes
+
+
+def best_wild_hand_table(hand):
+    """
+    best_wild_hand без перебора замен: для флеша джокеры получают ранги недостающих карт масти,
+    для остальных рук - ранги, по таблицам выбирается лучшая замена
+    """
+    jokers = [card for card in hand if card in JOKERS]
+    if not jokers:
+        return best_hand_table(hand)
+    base = encode_hand(card for card in hand if card not in JOKERS)
+    _, codes = _wild_candidates(base, jokers)
+    replaced = iter(CARD_NAMES[x] for x in codes)
+    cards = [next(replaced) if card in JOKERS else card for card in hand]
+    used = _best_mask(encode_hand(cards))[1]
+    return tuple(card for card in cards if used >> CARD_CODES[card] & 1)
+
+
+WILD_HAND_BACKENDS = {
+    'table': best_wild_hand_table,
+    'combinations': best_wild_hand_combinations,
+}
+
+
+def best_wild_hand(hand, backend='table'):
+    """best_hand но с джокерами"""
+    return WILD_HAND_BACKENDS[backend](hand)
+
+
+def _chunks(items, chunk_size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _map_chunks(func, chunks, workers):
+    """
+    Результаты func для каждого куска в порядке кусков.
+    При workers > 1 куски считаются в пуле процессов, в памяти не больше 2 * workers кусков
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield func(*chunk)
+        return
+    # таблицы строятся до запуска пула, чтобы процессы получили их при fork
+    _tables()
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, *chunk))
+        while pending:
+            yield pending.popleft().result()
+
+
+def _strengths_chunk(hands):
+    return [mask_strength(encode_hand(hand))[0] for hand in hands]
+
+
+def _best_hands_chunk(hands, backend):
+    return [best_hand(hand, backend) for hand in hands]
+
+
+def hand_strengths(hands, workers=1, chunk_size=10000):
+    """
+    Силы лучших рук для множества рук из 5-7 карт
+    :param hands: итерируемое рук - списков карт
+    :param workers: число процессов
+    :param chunk_size: число рук в одном задании процесса
+    :return: список сил в порядке рук
+    """
+    chunks = ((chunk,) for chunk in _chunks(hands, chunk_size))
+    return [x for result in _map_chunks(_strengths_chunk, chunks, workers) for x in result]
+
+
+def best_hands(hands, workers=1, chunk_size=10000, backend='table'):
+    """
+    best_hand для множества рук
+    :param hands: итерируемое рук из 7ми карт
+    :param workers: число процессов
+    :param chunk_size: число рук в одном задании процесса
+    :param backend: ключ BEST_HAND_BACKENDS
+    :return: список лучших рук в порядке рук
+    """
+    chunks = ((chunk, backend) for chunk in _chunks(hands, chunk_size))
+    return [x for result in _map_chunks(_best_hands_chunk, chunks, workers) for x in result]
+
+
+def _equity_chunk(hole, board, players, iterations, seed):
+    """Число побед, ничьих и поражений в iterations раздачах"""
+    rnd = random.Random(seed)
+    deck = [code for code in range(52) if not (hole | board) >> code & 1]
+    missing = 5 - bin(board).count('1')
+    need = missing + 2 * (players - 1)
+    win = tie = loss = 0
+    for _ in range(iterations):
+        cards = rnd.sample(deck, need)
+        full_board = board
+        for code in cards[:missing]:
+            full_board |= 1 << code
+        strength = mask_strength(hole | full_board)[0]
+        best_other = max(mask_strength(full_board | 1 << cards[index] | 1 << cards[index + 1])[0]
+                         for index in range(missing, need, 2))
+        if strength > best_other:
+            win += 1
+        elif strength == best_other:
+            tie += 1
+        else:
+            loss += 1
+    return win, tie, loss
+
+
+def equity(hole, board=(), players=2, iterations=10000, seed=None, workers=1, chunk_size=5000):
+    """
+    Оценка вероятностей выигрыша, ничьей и проигрыша методом Монте-Карло:
+    карты соперников и недостающие карты стола выбираются случайно из оставшейся колоды.
+    Раздачи делятся на куски по chunk_size с собственными seed, поэтому результат
+    с одним seed не зависит от числа процессов
+    :param hole: 2 карты игрока
+    :param board: 0-5 открытых карт стола
+    :param players: число игроков вместе с игроком
+    :param iterations: число раздач
+    :param seed: seed генератора, случайный если None
+    :param workers: число процессов
+    :param chunk_size: число раздач в одном задании процесса
+    :return: dict с вероятностями win, tie, loss
+    """
+    cards = list(hole) + list(board)
+    if len(hole) != 2 or len(board) > 5 or len(set(cards)) != len(cards):
+        raise ValueError(f'Expected 2 different hole cards and up to 5 board cards - {hole}, {board}')
+    if not 2 <= players <= (52 - 5 - 2) // 2 + 1:
+        raise ValueError(f'Wrong count of players - {players}')
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    chunks = ((encode_hand(hole), encode_hand(board), players, min(chunk_size, iterations - start), f'{seed}:{start}')
+              for start in range(0, iterations, chunk_size))
+    win = tie = loss = 0
+    for chunk_win, chunk_tie, chunk_loss in _map_chunks(_equity_chunk, chunks, workers):
+        win, tie, loss = win + chunk_win, tie + chunk_tie, loss + chunk_loss
+    return {'win': win / iterations, 'tie': tie / iterations, 'loss': loss / iterations}
+
+
+def encode_array(hands):
+    """
+    Руки из строк в массив кодов карт для rank_array
+    :param hands: итерируемое рук с одинаковым числом карт
+    :return: numpy массив (N, число карт)
+    """
+    return numpy.array([[CARD_CODES[card] for card in hand] for hand in hands], dtype=numpy.int64)
+
+
+@lru_cache(maxsize=None)
+def _bit_tables():
+    """Номер старшего бита (-1 для нуля) и число бит для всех масок из 13 бит"""
+    masks = range(_SUIT_BITS + 1)
+    return (numpy.array([x.bit_length() - 1 for x in masks], dtype=numpy.int64),
+            numpy.array([bin(x).count('1') for x in masks], dtype=numpy.int64))
+
+
+def _straight_high_array(ranks_mask, top):
+    """Номер старшего ранга стрита для каждой маски рангов или -1"""
+    run = ranks_mask & ranks_mask >> 1 & ranks_mask >> 2 & ranks_mask >> 3 & ranks_mask >> 4
+    return numpy.where(run != 0, top[run] + 4, numpy.where(ranks_mask & _WHEEL == _WHEEL, 3, -1))
+
+
+def _top_ranks(ranks_mask, count, top):
+    """count старших рангов каждой маски, отсутствующие ранги равны -1"""
+    result = []
+    for _ in range(count):
+        rank = top[ranks_mask]
+        result.append(rank)
+        ranks_mask = ranks_mask & ~numpy.left_shift(1, numpy.maximum(rank, 0))
+    return result
+
+
+def _array_key(category, ranks):
+    key = numpy.int64(category << 20)
+    for index, rank in enumerate(ranks):
+        key = key | (rank + 1) << 16 - 4 * index
+    return key
+
+
+def rank_array(cards):
+    """
+    Векторная оценка множества рук из 5-7 карт на numpy: маски мастей, гистограмма рангов
+    и стриты считаются битовыми операциями над массивами. Ключ собирается так же,
+    как в mask_rank, и равен hand_rank лучшей руки из 5ти карт
+    :param cards: массив (N, 5-7) кодов карт - значений CARD_CODES
+    :return: массив (N,) ключей int64, чем больше, тем сильнее рука
+    """
+    if numpy is None:
+        raise ImportError('numpy is required for rank_array')
+    top, bit_count = _bit_tables()
+    cards = numpy.asarray(cards, dtype=numpy.int64)
+    bits = numpy.left_shift(1, cards % 13)
+    suits = cards // 13
+    s0, s1, s2, s3 = (numpy.bitwise_or.reduce(numpy.where(suits == suit, bits, 0), axis=1) for suit in range(4))
+    low, high = s0 & s1, s2 & s3
+    any_ = s0 | s1 | s2 | s3
+    pairs = low | high | (s0 | s1) & (s2 | s3)
+    trips = low & (s2 | s3) | high & (s0 | s1)
+    quads = low & high
+    # в руке до 7ми карт флеш может быть только в одной масти
+    flush_mask = numpy.zeros_like(any_)
+    for suit_mask in (s0, s1, s2, s3):
+        flush_mask = numpy.where(bit_count[suit_mask] >= 5, suit_mask, flush_mask)
+    straight_flush = _straight_high_array(flush_mask, top)
+    straight_high = _straight_high_array(any_, top)
+    quad, trip, pair = top[quads], top[trips], top[pairs]
+    # вторая пара фулл-хауса может быть второй тройкой
+    full_pair = top[pairs & ~numpy.left_shift(1, numpy.maximum(trip, 0))]
+    second_pair = top[pairs & ~numpy.left_shift(1, numpy.maximum(pair, 0))]
+    two_pairs_mask = numpy.left_shift(1, numpy.maximum(pair, 0)) | numpy.left_shift(1, numpy.maximum(second_pair, 0))
+
+    def kickers(ranks_mask, used, count):
+        return _top_ranks(ranks_mask & ~numpy.left_shift(1, numpy.maximum(used, 0)), count, top)
+
+    return numpy.select(
+        [(straight_flush >= 0) & (flush_mask != 0), quads != 0, (trips != 0) & (full_pair >= 0), flush_mask != 0,
+         straight_high >= 0, trips != 0, second_pair >= 0, pairs != 0],
+        [_array_key(8, [straight_flush]),
+         _array_key(7, [quad] + kickers(any_, quad, 1)),
+         _array_key(6, [trip, full_pair]),
+         _array_key(5, _top_ranks(flush_mask, 5, top)),
+         _array_key(4, [straight_high]),
+         _array_key(3, [trip] + kickers(any_, trip, 2)),
+         _array_key(2, [pair, second_pair] + _top_ranks(any_ & ~two_pairs_mask, 1, top)),
+         _array_key(1, [pair] + kickers(any_, pair, 3))],
+        _array_key(0, _top_ranks(any_, 5, top)))
 
 
 def test_best_hand():
     print("test_best_hand...")
-    assert (sorted(best_hand("6C 7C 8C 9C TC 5C JS".split()))
-            == ['6C', '7C', '8C', '9C', 'TC'])
-    assert (sorted(best_hand("TD TC TH 7C 7D 8C 8S".split()))
-            == ['8C', '8S', 'TC', 'TD', 'TH'])
-    assert (sorted(best_hand("JD TC TH 7C 7D 7S 7H".split()))
-            == ['7C', '7D', '7H', '7S', 'JD'])
+    for backend in BEST_HAND_BACKENDS:
+        assert (sorted(best_hand("6C 7C 8C 9C TC 5C JS".split(), backend))
+                == ['6C', '7C', '8C', '9C', 'TC'])
+        assert (sorted(best_hand("TD TC TH 7C 7D 8C 8S".split(), backend))
+                == ['8C', '8S', 'TC', 'TD', 'TH'])
+        assert (sorted(best_hand("JD TC TH 7C 7D 7S 7H".split(), backend))
+                == ['7C', '7D', '7H', '7S', 'JD'])
+        assert (sorted(best_hand("AD 2C 3H 4C 5D 9S 9H".split(), backend))
+                == ['2C', '3H', '4C', '5D', 'AD'])
+    print('OK')
+
+
+def test_hand_rank():
+    print("test_hand_rank...")
+    assert hand_rank("AS KS QS JS TS".split()) > hand_rank("9H 9D 9S 9C 2D".split())
+    assert hand_rank("5H 4D 3S 2C AD".split()) < hand_rank("6H 5D 4S 3C 2D".split())
+    assert hand_rank("7H 7D 7S 2C 2D".split()) > hand_rank("AH AD AS KC QD".split())
+    assert hand_rank("KH KD 3S 3C 2D".split()) < hand_rank("KS KC 4S 4C 2H".split())
+    assert best_hand_of_list([]) is None
+    # руки, отличающиеся перестановкой мастей, берутся из кэша
+    rank_cache_clear()
+    assert hand_rank("AS AH 9C 8S 2D".split()) == hand_rank("AD AC 9H 8D 2S".split())
+    info = rank_cache_info()
+    assert (info['hits'], info['misses'], info['hit_rate']) == (1, 1, 0.5)
+    print('OK')
+
+
+def test_hand_strength():
+    print("test_hand_strength...")
+    deck = [rank + suit for rank in _sort_dict for suit in 'CSHD']
+    rnd = random.Random(1)
+    for _ in range(2000):
+        hand = rnd.sample(deck, 7)
+        assert sorted(decode_hand(encode_hand(hand))) == sorted(hand)
+        assert hand_rank(best_hand(hand, 'table')) == hand_rank(best_hand(hand, 'combinations')), hand
+        other = rnd.sample(deck, 5)
+        assert ((hand_strength(hand[:5]) > hand_strength(other)) ==
+                (hand_rank(hand[:5]) > hand_rank(other))), (hand[:5], other)
     print('OK')
 
 
 def test_best_wild_hand():
     print("test_best_wild_hand...")
-    assert (sorted(best_wild_hand("6C 7C 8C 9C TC 5C ?B".split()))
-            == ['7C', '8C', '9C', 'JC', 'TC'])
-    assert (sorted(best_wild_hand("TD TC 5H 5C 7C ?R ?B".split()))
-            == ['7C', 'TC', 'TD', 'TH', 'TS'])
-    assert (sorted(best_wild_hand("JD TC TH 7C 7D 7S 7H".split()))
-            == ['7C', '7D', '7H', '7S', 'JD'])
+    for backend in WILD_HAND_BACKENDS:
+        assert (sorted(best_wild_hand("6C 7C 8C 9C TC 5C ?B".split(), backend))
+                == ['7C', '8C', '9C', 'JC', 'TC'])
+        assert (sorted(best_wild_hand("TD TC 5H 5C 7C ?R ?B".split(), backend))
+                == ['7C', 'TC', 'TD', 'TH', 'TS'])
+        assert (sorted(best_wild_hand("JD TC TH 7C 7D 7S 7H".split(), backend))
+                == ['7C', '7D', '7H', '7S', 'JD'])
+    deck = [rank + suit for rank in _sort_dict for suit in 'CSHD']
+    rnd = random.Random(2)
+    for jokers in (['?B'], ['?R'], ['?B', '?R']):
+        for _ in range(20):
+            hand = rnd.sample(deck, 7 - len(jokers)) + jokers
+            rnd.shuffle(hand)
+            assert (hand_rank(best_wild_hand(hand, 'table'))
+                    == hand_rank(best_wild_hand(hand, 'combinations'))), hand
+    print('OK')
+
+
+def test_batch():
+    print("test_batch...")
+    deck = [rank + suit for rank in _sort_dict for suit in 'CSHD']
+    rnd = random.Random(3)
+    hands = [rnd.sample(deck, 7) for _ in range(500)]
+    assert hand_strengths(hands, workers=2, chunk_size=100) == [hand_strength(x) for x in hands]
+    assert best_hands(hands, workers=2, chunk_size=100) == [best_hand(x) for x in hands]
+    print('OK')
+
+
+def test_equity():
+    print("test_equity...")
+    # у всех роял-флеш на столе
+    assert equity("2C 3D".split(), "AS KS QS JS TS".split(), players=3, iterations=100) == {
+        'win': 0.0, 'tie': 1.0, 'loss': 0.0}
+    result = equity("AS AH".split(), iterations=4000, seed=1, chunk_size=1000)
+    assert result == equity("AS AH".split(), iterations=4000, seed=1, workers=2, chunk_size=1000)
+    # AA против случайной руки выигрывает около 85%
+    assert 0.82 < result['win'] < 0.88, result
+    assert abs(sum(result.values()) - 1) < 1e-9
+    print('OK')
+
+
+def test_rank_array():
+    print("test_rank_array...")
+    if numpy is None:
+        print('SKIP - no numpy')
+        return
+    deck = [rank + suit for rank in _sort_dict for suit in 'CSHD']
+    rnd = random.Random(4)
+    for size in (5, 6, 7):
+        hands = [rnd.sample(deck, size) for _ in range(3000)]
+        keys = rank_array(encode_array(hands))
+        ranks = [hand_rank(best_hand_combinations(x)) if size > 5 else hand_rank(x) for x in hands]
+        assert keys.tolist() == ranks
+        # сравнение с табличной оценкой на всех парах через сортировку
+        strengths = numpy.array(hand_strengths(hands))
+        order = numpy.lexsort((keys, strengths))
+        assert (numpy.diff(keys[order]) >= 0).all()
+        assert len(numpy.unique(keys)) == len(numpy.unique(strengths))
     print('OK')
 
 
 if __name__ == '__main__':
     test_best_hand()
+    test_hand_rank()
+    test_hand_strength()
     test_best_wild_hand()
+    test_batch()
+    test_rank_array()
+    test_equity()
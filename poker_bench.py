@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Correctness harness and benchmark of poker evaluators.
+
+    python poker_bench.py --exhaustive --hands 20000 --output poker.json
+
+Exhaustive check enumerates all 2,598,960 five-card hands and compares counts of hand classes
+with known frequencies, random check compares fast backends with brute force on seeded hands.
+Exit code is 1 if any check fails.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import combinations, islice
+
+import poker
+
+argparser = argparse.ArgumentParser(description='Correctness harness and benchmark of poker evaluators')
+argparser.add_argument('--exhaustive', action='store_true', help='Check all 2,598,960 five-card hands')
+argparser.add_argument('--hands', type=int, default=5000, help='Count of random 7-card hands')
+argparser.add_argument('--wild-hands', type=int, default=100, help='Count of random hands with jokers')
+argparser.add_argument('--seed', type=int, default=1)
+argparser.add_argument('--output', help='Save results to JSON file')
+
+CATEGORIES = ['high card', 'pair', 'two pair', 'three of a kind', 'straight', 'flush', 'full house',
+              'four of a kind', 'straight flush']
+# count of five-card hands in every category, royal flush is straight flush
+FREQUENCIES = [1302540, 1098240, 123552, 54912, 10200, 5108, 3744, 624, 40]
+CLASSES = 7462
+DECK = [rank + suit for rank in poker._sort_dict for suit in poker.SUITS]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def five_card_masks():
+    bits = [1 << code for code in range(52)]
+    for a, b, c, d, e in combinations(bits, 5):
+        yield a | b | c | d | e
+
+
+def check_counts(name, categories, classes):
+    """Compare counts of categories with FREQUENCIES, return list of errors"""
+    errors = [f'{name}: {CATEGORIES[index]} {categories[index]} != {expected}'
+              for index, expected in enumerate(FREQUENCIES) if categories[index] != expected]
+    if classes != CLASSES:
+        errors.append(f'{name}: {classes} classes != {CLASSES}')
+    return errors
+
+
+def exhaustive_mask_rank():
+    ranks = Counter(poker.mask_rank(mask) for mask in five_card_masks())
+    categories = Counter()
+    for rank, count in ranks.items():
+        categories[rank >> 20] += count
+    return categories, len(ranks)
+
+
+def exhaustive_table():
+    """Strength of table must be the same function of mask_rank for every hand"""
+    strengths, errors = {}, []
+    categories = Counter()
+    for mask in five_card_masks():
+        rank = poker.mask_rank(mask)
+        strength = poker.mask_strength(mask)[0]
+        if strengths.setdefault(rank, strength) != strength:
+            errors.append(f'table: {poker.decode_hand(mask)} strength {strength} != {strengths[rank]}')
+        categories[rank >> 20] += 1
+    ordered = [strengths[x] for x in sorted(strengths)]
+    if ordered != list(range(len(ordered))):
+        errors.append('table: order of strengths differs from order of hand_rank')
+    return categories, len(strengths), errors[:10]
+
+
+def exhaustive_numpy(chunk_size=500000):
+    numpy = poker.numpy
+    ranks = Counter()
+    hands = combinations(range(52), 5)
+    while True:
+        chunk = numpy.array(list(islice(hands, chunk_size)), dtype=numpy.int64)
+        if not len(chunk):
+            break
+        values, counts = numpy.unique(poker.rank_array(chunk), return_counts=True)
+        ranks.update(dict(zip(values.tolist(), counts.tolist())))
+    categories = Counter()
+    for rank, count in ranks.items():
+        categories[rank >> 20] += count
+    return categories, len(ranks)
+
+
+def random_hands(count, jokers, rnd):
+    hands = []
+    for _ in range(count):
+        wild = rnd.choice(jokers) if jokers else []
+        hand = rnd.sample(DECK, 7 - len(wild)) + wild
+        rnd.shuffle(hand)
+        hands.append(hand)
+    return hands
+
+
+def compare_backends(func, backends, hands, reference='combinations'):
+    """Compare hand_rank of every backend with reference, return list of errors and hands per second"""
+    errors, speed = [], {}
+    results = {}
+    for backend in backends:
+        started = time.perf_counter()
+        results[backend] = [func(hand, backend) for hand in hands]
+        speed[backend] = len(hands) / (time.perf_counter() - started)
+    for backend in backends:
+        for hand, result, expected in zip(hands, results[backend], results[reference]):
+            if poker.hand_rank(result) != poker.hand_rank(expected):
+                errors.append(f'{func.__name__} {backend}: {hand} -> {result}, {reference} -> {expected}')
+    return errors[:10], speed
+
+
+def measure(func, count):
+    started = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    args = argparser.parse_args()
+    rnd = random.Random(args.seed)
+    errors, checks, speed = [], {}, {}
+    if args.exhaustive:
+        started = time.perf_counter()
+        categories, classes = exhaustive_mask_rank()
+        speed['mask_rank exhaustive'] = sum(FREQUENCIES) / (time.perf_counter() - started)
+        errors += check_counts('mask_rank', categories, classes)
+        checks['categories'] = {CATEGORIES[x]: categories[x] for x in range(len(CATEGORIES))}
+        categories, classes, table_errors = exhaustive_table()
+        errors += check_counts('table', categories, classes) + table_errors
+        if poker.numpy is not None:
+            started = time.perf_counter()
+            categories, classes = exhaustive_numpy()
+            speed['rank_array exhaustive'] = sum(FREQUENCIES) / (time.perf_counter() - started)
+            errors += check_counts('rank_array', categories, classes)
+    # tables are built once on first use, their build is not measured as speed of backend
+    poker._tables()
+    hands = random_hands(args.hands, None, rnd)
+    backend_errors, best_speed = compare_backends(poker.best_hand, poker.BEST_HAND_BACKENDS, hands)
+    errors += backend_errors
+    speed.update({f'best_hand {x}': y for x, y in best_speed.items()})
+    wild_hands = random_hands(args.wild_hands, [['?B'], ['?R'], ['?B', '?R']], rnd)
+    backend_errors, wild_speed = compare_backends(poker.best_wild_hand, poker.WILD_HAND_BACKENDS, wild_hands)
+    errors += backend_errors
+    speed.update({f'best_wild_hand {x}': y for x, y in wild_speed.items()})
+    speed['hand_strengths'] = measure(lambda: poker.hand_strengths(hands), len(hands))
+    if poker.numpy is not None:
+        cards = poker.encode_array(hands)
+        speed['rank_array'] = measure(lambda: poker.rank_array(cards), len(hands))
+    speed['equity deals'] = measure(lambda: poker.equity(['AS', 'KS'], players=4, iterations=10000, seed=1), 10000)
+    for name, value in speed.items():
+        print(f'{name:28} {value:12.0f} hands/s')
+    for error in errors:
+        print(f'ERROR {error}')
+    print('OK' if not errors else f'{len(errors)} errors')
+    checks['rank_cache'] = poker.rank_cache_info()
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'commit': git_commit(),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'params': vars(args),
+                'checks': checks,
+                'errors': errors,
+                'speed': speed,
+            }, output_file, indent=2)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
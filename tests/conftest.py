@@ -0,0 +1,23 @@
+import pytest
+
+from log_analyzer import DEFAULT_CONFIG
+
+LINE = '1.1.1.1 -  - [29/Jun/2017:03:50:22 +0300] "GET {url} HTTP/1.1" 200 927 "-" "-" "-" "-" "-" {time}\n'
+
+
+@pytest.fixture
+def log_line():
+    """Makes line of ui_short log with url and request time"""
+    def make(url='/a', time=0.1):
+        return LINE.format(url=url, time=time)
+    return make
+
+
+@pytest.fixture
+def config(tmp_path):
+    """Default config with empty LOG_DIR, REPORT_DIR and CACHE_DIR in temporary folder"""
+    log_dir = tmp_path / 'log'
+    log_dir.mkdir()
+    report_dir = tmp_path / 'reports'
+    report_dir.mkdir()
+    return dict(DEFAULT_CONFIG, LOG_DIR=str(log_dir), REPORT_DIR=str(report_dir), CACHE_DIR=str(tmp_path / 'cache'))
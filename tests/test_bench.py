@@ -0,0 +1,15 @@
+import pytest
+
+from log_analyzer import file_iter, log_aggregate
+from log_analyzer_bench import generate_log
+
+
+@pytest.mark.parametrize('suffix', ['', '.gz'])
+def test_generate_log(tmp_path, suffix):
+    filename = str(tmp_path / f'nginx-access-ui.log-20170630{suffix}')
+    generate_log(filename, 2000, 50, 0.1, 'lognormal', 1)
+    result = log_aggregate(file_iter(filename), 0.2)
+    assert result.line_count == 2000
+    assert 0.05 < result.error_count / result.line_count < 0.15
+    assert 1 < len(result.urls) <= 50
+    assert all(x.startswith('/') for x in result.urls)
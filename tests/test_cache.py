@@ -0,0 +1,76 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+import log_analyzer
+from log_analyzer import day_aggregate, log_aggregate, range_aggregate, report_compute
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def config(config, tmp_path, log_line):
+    for day, times in (('20170629', (0.1, 0.2)), ('20170630', (0.3,)), ('20170701', (0.4, 0.5))):
+        (tmp_path / 'log' / f'nginx-access-ui.log-{day}').write_text(''.join(log_line('/a', x) for x in times))
+    return config
+
+
+def test_day_aggregate_cached(config):
+    log_info = log_analyzer.get_last_log(config['LOG_DIR'])
+    first = day_aggregate(log_info, config)
+    with mock.patch('log_analyzer.aggregate_log_file') as aggregate:
+        second = day_aggregate(log_info, config)
+    aggregate.assert_not_called()
+    assert report_compute(first, 10) == report_compute(second, 10)
+
+
+def test_day_aggregate_changed_log(config, log_line):
+    log_info = log_analyzer.get_last_log(config['LOG_DIR'])
+    day_aggregate(log_info, config)
+    with open(log_info.file_path, 'a') as log_file:
+        log_file.write(log_line('/b', 1.0))
+    result = day_aggregate(log_info, config)
+    assert sorted(result.urls) == ['/a', '/b']
+
+
+def test_range_aggregate(config, log_line):
+    result = range_aggregate(config, datetime(2017, 6, 30), datetime(2017, 7, 1))
+    with mock.patch('log_analyzer.aggregate_log_file') as aggregate:
+        cached = range_aggregate(config, datetime(2017, 6, 30), datetime(2017, 7, 1))
+    aggregate.assert_not_called()
+    lines = [log_line('/a', x) for x in (0.3, 0.4, 0.5)]
+    expected = report_compute(log_aggregate(lines, 0.1), 10)
+    assert report_compute(result, 10) == expected
+    assert report_compute(cached, 10) == expected
+    assert len(os.listdir(config['CACHE_DIR'])) == 2
+
+
+def test_range_aggregate_plain_and_gzip(config):
+    plain = f'{config["LOG_DIR"]}/nginx-access-ui.log-20170630'
+    with open(plain, 'rb') as plain_file, gzip.open(f'{plain}.gz', 'wb') as gzip_file:
+        gzip_file.write(plain_file.read())
+    result = range_aggregate(config, datetime(2017, 6, 30), datetime(2017, 6, 30))
+    with mock.patch('log_analyzer.aggregate_log_file') as aggregate:
+        range_aggregate(config, datetime(2017, 6, 30), datetime(2017, 6, 30))
+    aggregate.assert_not_called()
+    assert result.line_count == 1
+
+
+def test_range_aggregate_no_logs(config):
+    assert range_aggregate(config, datetime(2018, 1, 1), datetime(2018, 1, 2)) is None
+
+
+def test_aggregate_saved_by_script(config, tmp_path):
+    config_name = tmp_path / 'config.cfg'
+    config_name.write_text(json.dumps(config))
+    subprocess.run([sys.executable, 'log_analyzer.py', '--config', str(config_name)], cwd=ROOT, check=True)
+    log_info = log_analyzer.get_last_log(config['LOG_DIR'])
+    with mock.patch('log_analyzer.aggregate_log_file') as aggregate:
+        day_aggregate(log_info, config)
+    aggregate.assert_not_called()
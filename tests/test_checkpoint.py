@@ -0,0 +1,109 @@
+import gzip
+import os
+from unittest import mock
+
+import pytest
+
+import log_analyzer
+from log_analyzer import checkpoint_name, checkpointed_aggregate, log_aggregate, report_compute
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, CHECKPOINT_LINES=3)
+
+
+@pytest.fixture
+def lines(log_line):
+    return [log_line(f'/{x % 3}', x / 10) for x in range(10)]
+
+
+@pytest.mark.parametrize('gzipped', [False, True])
+def test_checkpointed_aggregate_resume(config, tmp_path, lines, gzipped):
+    log_name = str(tmp_path / ('nginx-access-ui.log-20170630' + ('.gz' if gzipped else '')))
+    with (gzip.open if gzipped else open)(log_name, 'wt') as log_file:
+        log_file.writelines(lines)
+
+    calls = []
+    original = log_analyzer._aggregate_bytes_lines
+
+    def crash_on_third_batch(*args):
+        calls.append(1)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return original(*args)
+
+    with mock.patch('log_analyzer._aggregate_bytes_lines', crash_on_third_batch):
+        with pytest.raises(KeyboardInterrupt):
+            checkpointed_aggregate(log_name, config)
+    assert os.path.exists(checkpoint_name(config['CACHE_DIR'], log_name))
+
+    with mock.patch('log_analyzer._aggregate_bytes_lines', wraps=original) as aggregate:
+        result = checkpointed_aggregate(log_name, config)
+    # 6 of 10 lines were saved in checkpoint, so only 2 batches are left
+    assert aggregate.call_count == 3
+    assert result.line_count == 10
+    assert report_compute(result, 10) == report_compute(log_aggregate(lines, 0.1), 10)
+    assert not os.path.exists(checkpoint_name(config['CACHE_DIR'], log_name))
+
+
+def test_checkpointed_aggregate_follow(config, tmp_path, lines):
+    log_name = str(tmp_path / 'nginx-access-ui.log')
+    with open(log_name, 'w') as log_file:
+        log_file.writelines(lines[:4])
+        log_file.write(lines[4][:10])
+    result = checkpointed_aggregate(log_name, config, follow=True)
+    assert result.line_count == 4
+
+    with open(log_name, 'a') as log_file:
+        log_file.write(lines[4][10:])
+        log_file.writelines(lines[5:])
+    with mock.patch('log_analyzer._aggregate_bytes_lines', wraps=log_analyzer._aggregate_bytes_lines) as aggregate:
+        result = checkpointed_aggregate(log_name, config, follow=True)
+    # 6 new lines in batches of 3 and the empty last one
+    assert aggregate.call_count == 3
+    assert report_compute(result, 10) == report_compute(log_aggregate(lines, 0.1), 10)
+
+
+def test_checkpointed_aggregate_follow_rotated(config, tmp_path, lines):
+    log_name = str(tmp_path / 'nginx-access-ui.log')
+    with open(log_name, 'w') as log_file:
+        log_file.writelines(lines)
+    checkpointed_aggregate(log_name, config, follow=True)
+
+    rotated_name = str(tmp_path / 'nginx-access-ui.log.new')
+    with open(rotated_name, 'w') as log_file:
+        log_file.writelines(lines[:2])
+    os.replace(rotated_name, log_name)
+    result = checkpointed_aggregate(log_name, config, follow=True)
+    assert result.line_count == 2
+
+
+def test_checkpointed_aggregate_empty(config, tmp_path):
+    path = tmp_path / 'nginx-access-ui.log-20170630'
+    path.write_text('')
+    assert checkpointed_aggregate(str(path), config).line_count == 0
+
+
+def test_checkpointed_aggregate_follow_line_completed(config, tmp_path, lines):
+    log_name = str(tmp_path / 'nginx-access-ui.log')
+    with open(log_name, 'w') as log_file:
+        log_file.writelines(lines[:4])
+        log_file.write(lines[4][:10])
+    original = log_analyzer._aggregate_bytes_lines
+
+    def complete_after_second_batch(*args):
+        result = original(*args)
+        if aggregate.call_count == 2:
+            # nginx finishes the line while next batch is started
+            with open(log_name, 'a') as log_file:
+                log_file.write(lines[4][10:])
+                log_file.writelines(lines[5:])
+        return result
+
+    with mock.patch('log_analyzer._aggregate_bytes_lines', side_effect=complete_after_second_batch) as aggregate:
+        result = checkpointed_aggregate(log_name, config, follow=True)
+    assert (result.line_count, result.error_count) == (4, 0)
+    result = checkpointed_aggregate(log_name, config, follow=True)
+    assert (result.line_count, result.error_count) == (10, 0)
+    assert report_compute(result, 10) == report_compute(log_aggregate(lines, 0.1), 10)
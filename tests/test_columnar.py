@@ -0,0 +1,52 @@
+import pickle
+import random
+
+import pytest
+
+import log_analyzer
+from log_analyzer import ColumnarLogStat, UrlNormalizer, log_aggregate, log_aggregate_bytes, report_compute
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def numpy_mode(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(log_analyzer, 'numpy', None)
+    return request.param
+
+
+def random_lines(count, urls, seed=1):
+    rnd = random.Random(seed)
+    return [f'e0 e1 e2 e3 e4 e5 e6 /url/{rnd.randint(1, urls)} eN {rnd.expovariate(5):.3f}' for _ in range(count)]
+
+
+def test_columnar_same_report(numpy_mode):
+    lines = random_lines(5000, 300)
+    expected = report_compute(log_aggregate(lines, 0.1), 1000)
+    result = log_aggregate(lines, 0.1, backend=ColumnarLogStat)
+    assert report_compute(result, 1000) == expected
+    result = log_aggregate_bytes([x.encode() for x in lines], 0.1, backend=ColumnarLogStat)
+    assert report_compute(result, 1000) == expected
+
+
+def test_columnar_merge(numpy_mode):
+    lines = random_lines(3000, 50)
+    expected = report_compute(log_aggregate(lines, 0.1), 100)
+    result = log_aggregate(lines[:1000], 0.1, backend=ColumnarLogStat)
+    for part in (lines[1000:1500], lines[1500:]):
+        result.merge(pickle.loads(pickle.dumps(log_aggregate(part, 0.1, backend=ColumnarLogStat))))
+    assert report_compute(result, 100) == expected
+
+
+def test_columnar_max_urls(numpy_mode):
+    lines = random_lines(1000, 20)
+    normalizer = UrlNormalizer(max_urls=5)
+    expected = report_compute(log_aggregate(lines, 0.1, normalizer=normalizer), 100)
+    result = log_aggregate(lines, 0.1, normalizer=normalizer, backend=ColumnarLogStat)
+    assert report_compute(result, 100) == expected
+    assert len(expected) == 6
+
+
+def test_columnar_empty(numpy_mode):
+    assert report_compute(ColumnarLogStat(), 10) == []
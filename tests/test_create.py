@@ -0,0 +1,46 @@
+import gzip
+import json
+import os
+import re
+from unittest import mock
+
+from log_analyzer import load_template, report_create
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'report.html')
+ROWS = [
+    {'url': '/api/</script>', 'count': 2, 'time_sum': '0.004'},
+    {'url': '/api/2', 'count': 1, 'time_sum': '0.001'},
+]
+
+
+def table_json(report):
+    return re.search(r'var table = (.*);\n', report).group(1)
+
+
+def test_report_create_json(tmp_path):
+    result_name = str(tmp_path / 'report-2017.06.30.html')
+    report_create(TEMPLATE, result_name, ROWS)
+    with open(result_name) as result_file:
+        report = result_file.read()
+    assert '</script>"' not in report
+    assert json.loads(table_json(report)) == ROWS
+    assert 'var tableSrc = "";' in report
+    assert os.listdir(tmp_path) == ['report-2017.06.30.html']
+
+
+def test_report_create_sidecar(tmp_path):
+    result_name = str(tmp_path / 'report-2017.06.30.html')
+    report_create(TEMPLATE, result_name, iter(ROWS), sidecar=True)
+    with open(result_name) as result_file:
+        report = result_file.read()
+    assert table_json(report) == 'null'
+    assert 'var tableSrc = "report-2017.06.30.json.gz";' in report
+    with gzip.open(tmp_path / 'report-2017.06.30.json.gz', 'rt') as sidecar_file:
+        assert json.load(sidecar_file) == ROWS
+
+
+def test_load_template_cached():
+    load_template(TEMPLATE)
+    with mock.patch('builtins.open') as template_open:
+        load_template(TEMPLATE)
+    template_open.assert_not_called()
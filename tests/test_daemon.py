@@ -0,0 +1,71 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+import log_analyzer
+from log_analyzer import daemon, ready_logs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def config(config):
+    return dict(config, DAEMON_POLL_INTERVAL=0.05)
+
+
+@pytest.fixture
+def line(log_line):
+    return log_line()
+
+
+def test_ready_logs_stable(config, tmp_path, line):
+    log_name = tmp_path / 'log' / 'nginx-access-ui.log-20170630'
+    log_name.write_text(line)
+    known_dates, signatures = set(), {}
+    assert ready_logs(config, known_dates, signatures) == []
+    # log is still written
+    with open(log_name, 'a') as log_file:
+        log_file.write(line)
+    assert ready_logs(config, known_dates, signatures) == []
+    result = ready_logs(config, known_dates, signatures)
+    assert [x.file_path for x in result] == [str(log_name)]
+    assert known_dates == {datetime(2017, 6, 30)}
+    assert ready_logs(config, known_dates, signatures) == []
+
+
+def test_ready_logs_reported(config, tmp_path, line):
+    (tmp_path / 'log' / 'nginx-access-ui.log-20170630').write_text(line)
+    (tmp_path / 'reports' / 'report-2017.06.30.html').write_text('')
+    known_dates, signatures = set(), {}
+    ready_logs(config, known_dates, signatures)
+    assert ready_logs(config, known_dates, signatures) == []
+    assert known_dates == {datetime(2017, 6, 30)}
+
+
+def test_daemon(config, tmp_path, line, monkeypatch):
+    (tmp_path / 'log' / 'nginx-access-ui.log-20170629').write_text(line)
+    (tmp_path / 'log' / 'nginx-access-ui.log-20170630').write_text(line)
+    monkeypatch.chdir(ROOT)
+
+    async def scenario():
+        stop = asyncio.Event()
+        task = asyncio.ensure_future(daemon(config, stop))
+        await wait_report('report-2017.06.30.html')
+        (tmp_path / 'log' / 'nginx-access-ui.log-20170701').write_text(line)
+        await wait_report('report-2017.07.01.html')
+        stop.set()
+        await asyncio.wait_for(task, 10)
+
+    async def wait_report(name):
+        for _ in range(200):
+            if os.path.exists(tmp_path / 'reports' / name):
+                return
+            await asyncio.sleep(0.05)
+        raise AssertionError(f'No report {name}')
+
+    asyncio.run(scenario())
+    # old logs are not reported by daemon
+    assert sorted(os.listdir(tmp_path / 'reports')) == ['report-2017.06.30.html', 'report-2017.07.01.html']
+    assert log_analyzer.get_last_log(config['LOG_DIR']).date == datetime(2017, 7, 1)
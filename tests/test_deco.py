@@ -0,0 +1,293 @@
+import asyncio
+import inspect
+import multiprocessing
+import sqlite3
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from deco import countcalls, memo, trace
+
+
+def test_memo_kwargs_order():
+    calls = []
+
+    @memo
+    def add(a, b=0, c=0):
+        calls.append((a, b, c))
+        return a + b + c
+
+    assert add(1, b=2, c=3) == add(1, c=3, b=2) == 6
+    assert add(1) == 1
+    assert calls == [(1, 2, 3), (1, 0, 0)]
+    assert add.cache_info() == (1, 2, None, 2)
+
+
+def test_memo_lru():
+    @memo(maxsize=2)
+    def square(x):
+        return x * x
+
+    square(1)
+    square(2)
+    square(1)
+    # 2 is the least recently used
+    square(3)
+    square(1)
+    assert square.cache_info() == (2, 3, 2, 2)
+    square(2)
+    assert square.cache_info().misses == 4
+    square.cache_clear()
+    assert square.cache_info() == (0, 0, 2, 0)
+
+
+def test_memo_ttl():
+    now = [100.0]
+
+    @memo(ttl=10)
+    def value(x):
+        return now[0]
+
+    with mock.patch('deco.time.monotonic', lambda: now[0]):
+        assert value(1) == 100.0
+        now[0] = 105.0
+        assert value(1) == 100.0
+        now[0] = 111.0
+        assert value(1) == 111.0
+
+
+def test_memo_ttl_expired_removed():
+    now = [100.0]
+
+    @memo(ttl=10)
+    def ident(x):
+        return x
+
+    with mock.patch('deco.time.monotonic', lambda: now[0]):
+        for x in range(100):
+            now[0] += 1
+            ident(x)
+        assert ident.cache_info().currsize == 10
+
+
+def test_memo_typed():
+    @memo(typed=True)
+    def kind(x):
+        return type(x).__name__
+
+    assert (kind(1), kind(1.0)) == ('int', 'float')
+
+
+def test_memo_recursion():
+    @memo(single_flight=True)
+    def fib(n):
+        return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+    assert fib(80) == 23416728348467685
+
+
+@pytest.mark.parametrize('single_flight,computations', [(True, 1), (False, 8)])
+def test_memo_single_flight(single_flight, computations):
+    calls = []
+    barrier = threading.Barrier(8)
+
+    @memo(single_flight=single_flight)
+    def slow(x):
+        calls.append(x)
+        time.sleep(0.1)
+        return x * 2
+
+    def call():
+        barrier.wait()
+        results.append(slow(21))
+
+    results = []
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 8
+    assert len(calls) == computations
+
+
+def test_memo_single_flight_error():
+    started = threading.Event()
+
+    @memo(single_flight=True)
+    def broken(x):
+        started.set()
+        time.sleep(0.1)
+        raise ValueError(x)
+
+    errors = []
+
+    def call():
+        try:
+            broken(1)
+        except ValueError as e:
+            errors.append(e)
+
+    first = threading.Thread(target=call)
+    first.start()
+    started.wait()
+    call()
+    first.join()
+    assert len(errors) == 2
+    assert broken.cache_info().currsize == 0
+
+
+def test_memo_async():
+    calls = []
+
+    @memo
+    async def double(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    async def scenario():
+        # concurrent awaiters share one computation
+        assert await asyncio.gather(double(1), double(1), double(2)) == [2, 2, 4]
+        assert await double(1) == 2
+
+    asyncio.run(scenario())
+    assert calls == [1, 2]
+    assert double.cache_info().currsize == 2
+
+
+def test_memo_async_error_not_cached():
+    calls = []
+
+    @memo
+    async def broken(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise ValueError(x)
+        return x
+
+    async def scenario():
+        results = await asyncio.gather(broken(1), broken(1), return_exceptions=True)
+        assert [type(x) for x in results] == [ValueError, ValueError]
+        assert await broken(1) == 1
+
+    asyncio.run(scenario())
+    assert calls == [1, 1]
+
+
+def test_async_countcalls_trace(capsys):
+    @countcalls
+    @trace('__')
+    @memo
+    async def fib(n):
+        return 1 if n <= 1 else await fib(n - 1) + await fib(n - 2)
+
+    assert inspect.iscoroutinefunction(fib)
+    assert asyncio.run(fib(3)) == 3
+    assert fib.calls == 5
+    assert capsys.readouterr().out.splitlines()[-1] == ' <-- fib(3,) == 3'
+
+
+def _rename(name):
+    def decorator(func):
+        func.__qualname__ = name
+        return func
+    return decorator
+
+
+def test_memo_path_persists(tmp_path):
+    path = str(tmp_path / 'memo.db')
+    calls = []
+
+    def square(x):
+        calls.append(x)
+        return {'square': x * x}
+
+    assert memo(path=path)(square)(3) == {'square': 9}
+    # new decorator is the same function after restart
+    cached = memo(path=path)(square)
+    assert cached(3) == {'square': 9}
+    assert calls == [3]
+    assert cached.cache_info().currsize == 1
+    cached.cache_clear()
+    assert cached(3) == {'square': 9}
+    assert calls == [3, 3]
+
+
+def test_memo_path_code_changed(tmp_path):
+    path = str(tmp_path / 'memo.db')
+
+    @memo(path=path)
+    @_rename('version')
+    def old(x):
+        return x + 1
+
+    @memo(path=path)
+    @_rename('version')
+    def new(x):
+        return x + 2
+
+    assert old(1) == 2
+    assert new(1) == 3
+    assert new.cache_info().currsize == 1
+
+
+def test_memo_path_code_changed_decorated(tmp_path):
+    path = str(tmp_path / 'memo.db')
+
+    # wrapper of countcalls has the same code for both functions
+    @memo(path=path)
+    @_rename('decorated')
+    @countcalls
+    def old(x):
+        return x + 1
+
+    @memo(path=path)
+    @_rename('decorated')
+    @countcalls
+    def new(x):
+        return x * 100
+
+    assert old(3) == 4
+    assert new(3) == 300
+
+
+def test_memo_path_maxsize_ttl(tmp_path):
+    path = str(tmp_path / 'memo.db')
+    calls = []
+
+    @memo(path=path, maxsize=2, ttl=60)
+    def ident(x):
+        calls.append(x)
+        return x
+
+    ident(1)
+    ident(2)
+    ident(1)
+    ident(3)
+    assert ident.cache_info().currsize == 2
+    ident(1)
+    ident(2)
+    assert calls == [1, 2, 3, 2]
+    with mock.patch('deco.time.time', return_value=time.time() + 61):
+        ident(1)
+    assert calls == [1, 2, 3, 2, 1]
+
+
+def _shared_square(path, x):
+    @memo(path=path)
+    def square(x):
+        return x * x
+    return square(x)
+
+
+def test_memo_path_processes(tmp_path):
+    path = str(tmp_path / 'memo.db')
+    with multiprocessing.get_context('spawn').Pool(4) as pool:
+        results = pool.starmap(_shared_square, [(path, x % 5) for x in range(40)])
+    assert results == [(x % 5) ** 2 for x in range(40)]
+    with sqlite3.connect(path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM memo').fetchone()[0] == 5
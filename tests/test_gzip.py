@@ -0,0 +1,78 @@
+import gzip
+import shutil
+
+import pytest
+
+from log_analyzer import (aggregate_log_file, background_iter, file_iter, gzip_command, gzip_file_iter,
+                          log_aggregate, report_compute)
+
+COMMANDS = [None] + [x for x in [('zcat',), ('pigz', '-dc')] if shutil.which(x[0])]
+
+
+@pytest.fixture
+def gzip_log(tmp_path, log_line):
+    filename = str(tmp_path / 'nginx-access-ui.log-20170630.gz')
+    with gzip.open(filename, 'wt') as log_file:
+        for index in range(5000):
+            log_file.write(log_line(f'/api/{index % 37}', index / 1000))
+        # last line without new line
+        log_file.write('broken line')
+    return filename
+
+
+@pytest.mark.parametrize('command', COMMANDS)
+def test_gzip_file_iter(gzip_log, command):
+    with gzip.open(gzip_log, 'rb') as log_file:
+        expected = log_file.readlines()
+    assert list(gzip_file_iter(gzip_log, command, block_size=1000)) == expected
+
+
+@pytest.mark.parametrize('command', [None, ('zcat',)])
+def test_gzip_file_iter_broken(tmp_path, command):
+    if command is not None and not shutil.which(command[0]):
+        pytest.skip('no zcat')
+    filename = str(tmp_path / 'broken.gz')
+    with open(filename, 'wb') as log_file:
+        log_file.write(b'not gzip')
+    with pytest.raises(OSError):
+        list(gzip_file_iter(filename, command))
+
+
+def test_gzip_file_iter_noisy_command(gzip_log):
+    if not shutil.which('zcat'):
+        pytest.skip('no zcat')
+    # more stderr than pipe buffer is written before output
+    command = ('sh', '-c', 'head -c 1000000 /dev/zero >&2; zcat "$0"')
+    with gzip.open(gzip_log, 'rb') as log_file:
+        expected = log_file.readlines()
+    assert list(gzip_file_iter(gzip_log, command)) == expected
+
+
+@pytest.mark.parametrize('command', COMMANDS)
+def test_gzip_file_iter_closed_early(gzip_log, command):
+    lines = gzip_file_iter(gzip_log, command, block_size=100)
+    assert next(lines).startswith(b'1.1.1.1')
+    lines.close()
+
+
+def test_background_iter_error():
+    def items():
+        yield 1
+        raise ValueError('broken')
+
+    result = background_iter(items())
+    assert next(result) == 1
+    with pytest.raises(ValueError):
+        next(result)
+
+
+def test_gzip_command():
+    assert gzip_command('python') is None
+    assert gzip_command('pigz -dc -p 4') == ('pigz', '-dc', '-p', '4')
+
+
+@pytest.mark.parametrize('name', ['auto', 'python'])
+def test_aggregate_gzip(gzip_log, config, name):
+    expected = log_aggregate(file_iter(gzip_log), 0.1)
+    result = aggregate_log_file(gzip_log, dict(config, GZIP_COMMAND=name))
+    assert report_compute(result, 100) == report_compute(expected, 100)
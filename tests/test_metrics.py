@@ -0,0 +1,66 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+
+import log_analyzer
+from log_analyzer import RunMetrics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_stage_disabled():
+    metrics = RunMetrics()
+    with metrics.stage('aggregate') as stage:
+        stage.lines = 10
+    assert metrics.stages == {}
+
+
+def test_stage_summed():
+    metrics = RunMetrics(enabled=True)
+    for lines in (10, 20):
+        with metrics.stage('aggregate') as stage:
+            stage.lines = lines
+            stage.bytes_read = 100
+    stat = metrics.stages['aggregate']
+    assert (stat.calls, stat.lines, stat.bytes_read) == (2, 30, 200)
+    assert stat.seconds >= 0 and stat.cpu_seconds >= 0
+
+
+def test_stage_child_processes():
+    metrics = RunMetrics(enabled=True)
+    with metrics.stage('aggregate'):
+        subprocess.run([sys.executable, '-c', 'sum(range(10 ** 7))'], check=True)
+    assert metrics.stages['aggregate'].cpu_seconds > 0.05
+
+
+def test_prometheus():
+    metrics = RunMetrics(enabled=True)
+    with metrics.stage('report_create'):
+        pass
+    text = metrics.prometheus(success=True)
+    assert '# TYPE log_analyzer_stage_seconds gauge\n' in text
+    assert 'log_analyzer_stage_lines{stage="report_create"} 0\n' in text
+    assert 'log_analyzer_run_success 1\n' in text
+    assert text.endswith('\n')
+
+
+def test_main_metrics_and_profile(config, tmp_path, log_line, monkeypatch):
+    (tmp_path / 'log' / 'nginx-access-ui.log-20170630').write_text(''.join(log_line('/a', x) for x in (0.1, 0.2)))
+    config_name = tmp_path / 'config.cfg'
+    config_name.write_text(json.dumps(config))
+    metrics_name = str(tmp_path / 'log_analyzer.prom')
+    profile_name = str(tmp_path / 'run.pstats')
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(log_analyzer, 'run_metrics', RunMetrics())
+    monkeypatch.setattr(sys, 'argv', ['log_analyzer.py', '--config', str(config_name),
+                                      '--metrics-file', metrics_name, '--profile', profile_name])
+    log_analyzer.main()
+    with open(metrics_name) as metrics_file:
+        text = metrics_file.read()
+    for stage in ('find_logs', 'aggregate', 'save_aggregate', 'report_compute', 'report_create'):
+        assert f'log_analyzer_stage_seconds{{stage="{stage}"}}' in text
+    assert 'log_analyzer_stage_lines{stage="aggregate"} 2\n' in text
+    assert pstats.Stats(profile_name).total_calls > 0
+    assert os.path.exists(tmp_path / 'reports' / 'report-2017.06.30.html')
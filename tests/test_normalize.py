@@ -0,0 +1,32 @@
+from log_analyzer import OTHER_URL, UrlNormalizer, log_aggregate, log_aggregate_bytes
+
+
+def test_normalize_query():
+    assert UrlNormalizer()('/api/v2/banner?id=1') == '/api/v2/banner?id=1'
+    assert UrlNormalizer('strip')('/api/v2/banner?id=1') == '/api/v2/banner'
+    assert UrlNormalizer('keys')('/api/v2/banner?page=2&id=1&id=3') == '/api/v2/banner?id&page'
+
+
+def test_normalize_ids():
+    normalizer = UrlNormalizer(collapse_ids=True)
+    assert normalizer('/api/v2/banner/25019354') == '/api/v2/banner/{id}'
+    assert normalizer('/api/1/user/dc7161be3a/') == '/api/{id}/user/{hex}/'
+    assert normalizer('/slot/4705/groups') == '/slot/{id}/groups'
+    assert normalizer('/file/0a8c37e5-7b47-4c5e-9d4f-3f6c3f5c6b1a') == '/file/{uuid}'
+    # words and short hex-like segments are kept
+    assert normalizer('/api/v2/facebook/cafe12') == '/api/v2/facebook/cafe12'
+
+
+def test_normalize_rules():
+    normalizer = UrlNormalizer(rules=[[r'^/export/.*', '/export/*'], [r'/+$', '']])
+    assert normalizer('/export/report/1.csv') == '/export/*'
+    assert normalizer('/api/v2/') == '/api/v2'
+
+
+def test_normalize_max_urls():
+    lines = [f'e0 e1 e2 e3 e4 e5 e6 /url{x % 5}/{x} eN 0.1' for x in range(20)]
+    for aggregate, data in ((log_aggregate, lines), (log_aggregate_bytes, [x.encode() for x in lines])):
+        result = aggregate(data, 0.1, normalizer=UrlNormalizer(collapse_ids=True, max_urls=3))
+        assert sorted(result.urls) == ['/url0/{id}', '/url1/{id}', '/url2/{id}', OTHER_URL]
+        assert result.urls[OTHER_URL].count == 8
+        assert result.request_count == 20
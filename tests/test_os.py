@@ -1,37 +1,61 @@
+import os
+from types import SimpleNamespace
 from unittest import mock
 
-from log_analyzer import get_last_log
+from log_analyzer import backfill, get_last_log
+
+
+def fake_scandir(names):
+    scandir = mock.MagicMock()
+    scandir.return_value.__enter__.return_value = [SimpleNamespace(name=x) for x in names]
+    return scandir
 
 
 # get_last_log
 
-@mock.patch('log_analyzer.os.listdir', return_value=['nginx-access-ui.log-20170630',
-                                                     'nginx-access-ui.log-20170830'])
-def test_get_last_log_correct(_):
+@mock.patch('log_analyzer.os.scandir', fake_scandir(['nginx-access-ui.log-20170630',
+                                                     'nginx-access-ui.log-20170830']))
+def test_get_last_log_correct():
     file = get_last_log('.')
     assert file.file_path == './nginx-access-ui.log-20170830', file.file_path
     assert file.date.strftime('%d.%m.%Y') == '30.08.2017', file.date
 
 
-@mock.patch('log_analyzer.os.listdir', return_value=['nginx-access-ui.log-20170630.gz',
-                                                     'nginx-access-ui.log-20170830.gz'])
-def test_get_last_log_correct_gzip(_):
+@mock.patch('log_analyzer.os.scandir', fake_scandir(['nginx-access-ui.log-20170630.gz',
+                                                     'nginx-access-ui.log-20170830.gz']))
+def test_get_last_log_correct_gzip():
     file = get_last_log('.')
     assert file.file_path == './nginx-access-ui.log-20170830.gz', file.file_path
     assert file.date.strftime('%d.%m.%Y') == '30.08.2017', file.date
 
 
-@mock.patch('log_analyzer.os.listdir', return_value=[])
-def test_get_last_log_nolog(_):
+@mock.patch('log_analyzer.os.scandir', fake_scandir([]))
+def test_get_last_log_nolog():
     file = get_last_log('.')
     assert file is None
 
 
-@mock.patch('log_analyzer.os.listdir', return_value=['nginx-access-ui.log-20170630.gz2',
+@mock.patch('log_analyzer.os.scandir', fake_scandir(['nginx-access-ui.log-20170630.gz2',
                                                      'nginx-access-ui.log-20170630.aaa',
                                                      'nginx-other_serv.log-20170630.gz',
                                                      'AAAnginx-access-ui.log-20170630.gz',
-                                                     '1'])
-def test_get_last_log_other_logs(_):
+                                                     '1']))
+def test_get_last_log_other_logs():
     file = get_last_log('.')
     assert file is None
+
+
+# backfill
+
+def test_backfill(config, tmp_path, log_line, monkeypatch):
+    report_dir = tmp_path / 'reports'
+    for day in ('20170629', '20170630', '20170701'):
+        (tmp_path / 'log' / f'nginx-access-ui.log-{day}').write_text(log_line())
+    (report_dir / 'report-2017.06.30.html').write_text('')
+    config = dict(config, REPORT_SIZE=10, WORKERS=2)
+    # template is read by relative path
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    created = backfill(config)
+    assert created == [f'{report_dir}/report-2017.06.29.html', f'{report_dir}/report-2017.07.01.html'], created
+    assert os.path.getsize(report_dir / 'report-2017.06.30.html') == 0
+    assert backfill(config) == []
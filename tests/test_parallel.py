@@ -0,0 +1,79 @@
+import gzip
+import random
+
+import pytest
+
+from log_analyzer import (aggregate_log_file, chunk_ranges, file_iter, log_aggregate, log_aggregate_bytes,
+                          mmap_file_iter, parallel_aggregate, report_compute)
+
+
+@pytest.fixture(params=['plain', 'gzip'])
+def log_file(request, tmp_path, log_line):
+    rnd = random.Random(1)
+    lines = []
+    # many urls with close sums, float sums of parts would differ from sums of the whole log
+    for i in range(50000):
+        if i % 97 == 0:
+            lines.append('broken line\n')
+        else:
+            lines.append(log_line(f'/api/{rnd.randint(1, 2000)}', f'{rnd.lognormvariate(-2, 1):.3f}'))
+    if request.param == 'gzip':
+        path = tmp_path / 'nginx-access-ui.log-20170630.gz'
+        with gzip.open(path, 'wt') as file:
+            file.writelines(lines)
+    else:
+        path = tmp_path / 'nginx-access-ui.log-20170630'
+        path.write_text(''.join(lines))
+    return str(path)
+
+
+def test_parallel_aggregate_same_report(log_file):
+    expected = log_aggregate(file_iter(log_file), 0.1)
+    result = parallel_aggregate(log_file, 0.1, 3)
+    assert (result.line_count, result.error_count) == (expected.line_count, expected.error_count)
+    assert report_compute(result, 2000) == report_compute(expected, 2000)
+
+
+def test_parallel_aggregate_errors(log_file):
+    with pytest.raises(RuntimeError) as error:
+        log_aggregate(file_iter(log_file), 0.001)
+    with pytest.raises(RuntimeError) as parallel_error:
+        parallel_aggregate(log_file, 0.001, 2)
+    assert str(error.value) == str(parallel_error.value)
+
+
+def test_chunk_ranges(tmp_path):
+    path = tmp_path / 'log'
+    path.write_bytes(b'aaaa\nbb\ncccccccc\nd')
+    ranges = chunk_ranges(str(path), 4)
+    assert ranges == [(0, 5), (5, 17), (17, 18)], ranges
+
+
+def test_mmap_aggregate_same_report(log_file):
+    if log_file.endswith('.gz'):
+        pytest.skip('mmap is used only for plain logs')
+    expected = log_aggregate(file_iter(log_file), 0.1)
+    result = log_aggregate_bytes(mmap_file_iter(log_file), 0.1)
+    assert (result.line_count, result.error_count) == (expected.line_count, expected.error_count)
+    assert report_compute(result, 100) == report_compute(expected, 100)
+
+
+def test_mmap_file_iter_empty(tmp_path):
+    path = tmp_path / 'log'
+    path.write_bytes(b'')
+    assert list(mmap_file_iter(str(path))) == []
+
+
+@pytest.mark.parametrize('options', [
+    {'WORKERS': 2},
+    {'CHECKPOINT_LINES': 200},
+])
+def test_max_urls_parts(config, tmp_path, log_line, options):
+    urls = ['/A'] * 200 + ['/X', '/Y'] + ['/A'] * 198
+    path = tmp_path / 'nginx-access-ui.log-20170630'
+    path.write_text(''.join(log_line(url, 0.5) for url in urls))
+    config = dict(config, MAX_URLS=2)
+    expected = aggregate_log_file(str(path), config)
+    result = aggregate_log_file(str(path), dict(config, **options))
+    assert {x: y.count for x, y in expected.urls.items()} == {'/A': 398, '/X': 1, 'other': 1}
+    assert report_compute(result, 10) == report_compute(expected, 10)
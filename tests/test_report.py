@@ -1,4 +1,4 @@
-from log_analyzer import log_parse, report_compute
+from log_analyzer import log_aggregate, log_aggregate_bytes, log_parse, quantile_estimator, report_compute
 
 
 # log_parse
@@ -45,6 +45,53 @@ def test_log_parse_error_percent():
     assert result == [('url', 0.001), ('url', 0.002)]
 
 
+# log_aggregate
+def test_log_aggregate_normal():
+    data = [
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 url elemN 0.001',
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 url elemN 0.003',
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 url2 elemN 0.002'
+    ]
+    result = log_aggregate(data, 0.1)
+    assert result.line_count == 3 and result.error_count == 0
+    assert result.request_count == 3
+    assert sorted(result.urls) == ['url', 'url2']
+    assert result.urls['url'].count == 2
+    assert result.urls['url'].time_max == 0.003
+    assert list(result.urls['url'].quantiles.values) == [0.001, 0.003]
+
+
+def test_log_aggregate_error_percent():
+    data_bad = [
+        'elem3 elem4 elem5 elem6 url elemN 0.001',
+        'elem3 elem4 elem5 elem6 url elemN 0.001',
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 url elemN 0.002'
+    ]
+    result = None
+    try:
+        result = log_aggregate(data_bad, 0.5)
+    except RuntimeError as e:
+        assert str(e) == f'Too many parsing exceptions - {2/3}'
+    assert result is None
+
+    result = log_aggregate(data_bad[1:], 0.5)
+    assert result.error_count == 1 and result.request_count == 1
+
+
+def test_log_aggregate_bytes_same_as_text():
+    data = [
+        'elem3 elem4 elem5 elem6 url elemN 0.001\n',
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 url elemN 0.001\n',
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 /урл elemN 0.002\n',
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 url\n',
+        'elem0 elem1 elem2 elem3 elem4 elem5 elem6 0.5\n'
+    ]
+    expected = log_aggregate(data, 0.5)
+    result = log_aggregate_bytes([x.encode('utf-8') for x in data], 0.5)
+    assert (result.line_count, result.error_count) == (expected.line_count, expected.error_count)
+    assert report_compute(result, 10) == report_compute(expected, 10)
+
+
 # report_compute
 def test_report_compute_one_value():
     log_data = [
@@ -60,7 +107,9 @@ def test_report_compute_one_value():
             'time_perc': '1.000',
             'time_avg': '0.001',
             'time_max': '0.001',
-            'time_med': '0.001'
+            'time_med': '0.001',
+            'time_p95': '0.001',
+            'time_p99': '0.001'
         }
     ]
     assert result == expected_result, result
@@ -82,7 +131,9 @@ def test_report_compute_some_values():
             'time_perc': '0.800',
             'time_avg': '0.002',
             'time_max': '0.003',
-            'time_med': '0.002'
+            'time_med': '0.002',
+            'time_p95': '0.003',
+            'time_p99': '0.003'
         },
         {
             'url': 'url2',
@@ -92,7 +143,9 @@ def test_report_compute_some_values():
             'time_perc': '0.200',
             'time_avg': '0.001',
             'time_max': '0.001',
-            'time_med': '0.001'
+            'time_med': '0.001',
+            'time_p95': '0.001',
+            'time_p99': '0.001'
         }
     ]
     assert result == expected_result, result
@@ -130,7 +183,42 @@ def test_report_compute_count():
             'time_perc': '0.800',
             'time_avg': '0.002',
             'time_max': '0.003',
-            'time_med': '0.002'
+            'time_med': '0.002',
+            'time_p95': '0.003',
+            'time_p99': '0.003'
         }
     ]
     assert result == expected_result, result
+
+
+def test_report_compute_aggregated():
+    log_data = [
+        ('url', 0.001),
+        ('url', 0.003),
+        ('url2', 0.001)
+    ]
+    lines = [f'e0 e1 e2 e3 e4 e5 e6 {url} eN {time}' for url, time in log_data]
+    result = report_compute(log_aggregate(lines, 0.1), 10)
+    assert result == report_compute(log_data, 10), result
+
+
+def test_report_compute_approx_quantiles():
+    log_data = [('url', x / 1000) for x in range(1, 1001)]
+    exact = report_compute(log_data, 10)[0]
+    lines = [f'e0 e1 e2 e3 e4 e5 e6 {url} eN {time}' for url, time in log_data]
+    approx = report_compute(log_aggregate(lines, 0.1, quantile_estimator('approx', 0.01)), 10)[0]
+    for key in ('time_med', 'time_p95', 'time_p99'):
+        assert abs(float(approx[key]) - float(exact[key])) <= float(exact[key]) * 0.01 + 0.001, key
+    assert approx['time_sum'] == exact['time_sum']
+    assert exact['time_p95'] == '0.950' and exact['time_p99'] == '0.990', exact
+
+
+def test_report_compute_numeric_order():
+    log_data = [
+        ('url9', 9.0),
+        ('url10', 10.0),
+        ('url1', 1.0),
+        ('url_small', 0.0004)
+    ]
+    result = report_compute(log_data, 3)
+    assert [x['url'] for x in result] == ['url10', 'url9', 'url1'], result